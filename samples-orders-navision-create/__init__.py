@@ -1,24 +1,108 @@
 import logging
+import os
 
 import azure.functions as func
 
-from .country_vat import CountryVat
+from .coalesce import coalescer, timestamp
+from .idempotency import ClaimInProgress, idempotency
 from .order import generate_order_data
-from .schema import OrderEventPayload
-from .navision import navision
+from .payload import decode_order_event
+from .profiling import profiler
+from .navision import Deadline, DeadlineExceeded, DuplicateOrderError, OrderValidationError, navision
+from .validation import validator
+
+navision.validator = validator
+
+# Send CreateOrder straight away and only check for an existing order when NAV reports a duplicate.
+# Opt-in: it relies on the Gateway refusing order numbers that are already posted as well as open ones.
+OPTIMISTIC_CREATE = os.environ.get("NAVISION_OPTIMISTIC_CREATE", "").lower() in ('1', 'true', 'yes')
+
+# Seconds an invocation may spend before it gives up on NAV. It has to end well inside the idempotency
+# lease (itself below the functionTimeout in host.json), or a redelivery could take over the claim while
+# this invocation is still creating the order, so it defaults to and is capped at 30s less than the lease
+# (half of it for leases under a minute).
+INVOCATION_BUDGET = min(
+    float(os.environ.get("NAVISION_INVOCATION_BUDGET", "0")) or idempotency.lease,
+    max(idempotency.lease - 30, idempotency.lease / 2),
+)
 
 
 def main(event: func.EventGridEvent):
-    data: OrderEventPayload = event.get_json()
+    with profiler.profile() as profile:
+        return handle_event(event, profile)
+
+
+def handle_event(event, profile):
+    deadline = Deadline(INVOCATION_BUDGET)
+    # The worker has already parsed the event, so this costs a little CPU (see benchmarks/payload.py);
+    # it is kept for the typed projection and the country_code fill-in generate_order_data relies on
+    data = decode_order_event(event.get_json())
+    profile.label = 'order-%s' % data["order_number"]
     logging.info('Creating order %s in navision - order=%s', data["order_number"], data["id"])
 
+    keys = ('event:%s' % event.id, 'order:%s' % data["order_number"])
+    # A redelivery of a completed order is acknowledged straight away rather than after the coalescing window
+    if idempotency.completed(keys):
+        logging.info('Skipping duplicate delivery of order %s - event=%s', data["order_number"], event.id)
+        return True
+
+    # Only the newest of a burst of events about one order goes on to NAV
+    if not coalescer.newest(data["order_number"], timestamp(data["updated_at"])):
+        logging.info('Skipping order %s, superseded by a newer event - event=%s', data["order_number"], event.id)
+        return True
+
+    try:
+        claim = idempotency.claim(keys)
+    except ClaimInProgress:
+        # The claimant may have been killed, so fail and let EventGrid retry once its lease expires
+        logging.warning('Order %s is in progress elsewhere, failing for a retry - event=%s',
+                        data["order_number"], event.id)
+        raise
+    if claim is None:
+        logging.info('Skipping duplicate delivery of order %s - event=%s', data["order_number"], event.id)
+        return True
+
+    try:
+        with navision.deadline(deadline):
+            result = handle_order(data)
+    except OrderValidationError as e:
+        # Retrying cannot fix the order, so acknowledge the event instead of failing it
+        logging.error('Rejected order %s - %s', data["order_number"], e)
+        idempotency.complete(claim)
+        return False
+    except DeadlineExceeded as e:
+        # Fail while there is still time to release the claim, so the redelivery can retry the order
+        logging.warning('Gave up on order %s - %s', data["order_number"], e)
+        idempotency.release(claim)
+        raise
+    except Exception:
+        idempotency.release(claim)
+        raise
+
+    idempotency.complete(claim)
+    return result
+
+
+def handle_order(data):
+    if OPTIMISTIC_CREATE:
+        return create_order_optimistically(data)
+
     if navision.order_exists(data["order_number"]):
         return True
     if navision.posted_shipment_exists(data["order_number"]):
         return True
 
-    # TODO CREATE ORDER FROM DATA
     order = generate_order_data(data)
 
     return navision.create_order(order)
-    
+
+
+def create_order_optimistically(data):
+    order = generate_order_data(data)
+    try:
+        return navision.create_order(order)
+    except DuplicateOrderError:
+        if navision.order_exists(data["order_number"]) or navision.posted_shipment_exists(data["order_number"]):
+            logging.info('Order %s already exists in navision', data["order_number"])
+            return True
+        raise
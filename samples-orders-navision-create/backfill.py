@@ -0,0 +1,201 @@
+"""Replays archived order events through the order create path
+
+    python -m samples-orders-navision-create.backfill events.jsonl [more.jsonl ...] \\
+        --workers 8 --rate 50 --checkpoint backfill.checkpoint --failed backfill.failed
+
+Each line is an EventGrid event or a bare Shopify order payload. Events are
+sharded by order number over a pool of processes, so every order is handled
+by one process and in file order. The checkpoint records, per file, the
+offset up to which every line has been handled; rerunning with the same
+checkpoint resumes from there. Failed lines are appended unchanged to the
+failed file (by default the checkpoint path plus .failed) before the
+checkpoint moves past them, so they can be retried with
+
+    python -m samples-orders-navision-create.backfill backfill.failed
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+
+from . import handle_order
+from .jobs import Progress, write_json_atomic
+from .lanes import lane_for
+from .navision import navision
+from .payload import decode_order_event
+from .scheduler import BULK
+
+logger = logging.getLogger(__name__)
+
+
+def _worker(tasks, results):
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        path, offset, data = task
+        try:
+            with navision.priority(BULK):
+                handle_order(data)
+        except Exception as e:
+            logger.exception('Backfill of order %s failed', data["order_number"])
+            results.put((path, offset, repr(e)))
+        else:
+            results.put((path, offset, None))
+
+
+def _read_events(path, offset):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            end = f.tell()
+            if line.strip():
+                yield offset, end, line
+            offset = end
+
+
+class Backfill(object):
+    def __init__(self, paths, workers, rate=None, checkpoint=None, queue_size=100, failed=None):
+        self.paths = paths
+        self.workers = workers
+        self.rate = rate
+        self.checkpoint = checkpoint
+        self.queue_size = queue_size
+
+        if failed is None and checkpoint:
+            failed = checkpoint + '.failed'
+        if failed and os.path.abspath(failed) in map(os.path.abspath, paths):
+            raise ValueError('The failed file %s cannot also be replayed in the same run' % failed)
+        self.failed = failed
+        self._failed_file = open(failed, 'ab') if failed else None
+
+        self.offsets = {}
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                self.offsets = json.load(f)
+
+        # path -> {offset: end} of dispatched lines, in dispatch order, and the finished subset
+        self.pending = {}
+        self.finished = {}
+        self.progress = Progress('backfill')
+        self._checkpointed = time.monotonic()
+
+    def run(self):
+        results = multiprocessing.Queue()
+        shards = [multiprocessing.Queue(self.queue_size) for _ in range(self.workers)]
+        processes = [multiprocessing.Process(target=_worker, args=(tasks, results), daemon=True) for tasks in shards]
+        for process in processes:
+            process.start()
+
+        started = time.monotonic()
+        dispatched = 0
+        for path in self.paths:
+            pending = self.pending.setdefault(path, {})
+            self.finished.setdefault(path, set())
+
+            for offset, end, line in _read_events(path, self.offsets.get(path, 0)):
+                if self.rate:
+                    delay = started + dispatched / self.rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                self._drain(results)
+
+                pending[offset] = end
+                try:
+                    data = decode_order_event(line)
+                    shard = shards[lane_for(data["order_number"], self.workers)]
+                except Exception:
+                    logger.exception('Invalid order event in %s at offset %s', path, offset)
+                    self._finish(path, offset, 'invalid event')
+                    continue
+                shard.put((path, offset, data))
+                dispatched += 1
+
+        for tasks in shards:
+            tasks.put(None)
+        while any(self.pending.values()):
+            if not any(process.is_alive() for process in processes) and results.empty():
+                logger.error('Backfill workers exited with events outstanding')
+                break
+            self._drain(results, block=True)
+        for process in processes:
+            process.join()
+
+        self._write_checkpoint()
+        if self._failed_file is not None:
+            self._failed_file.close()
+        self.progress.finish()
+        if self.progress.errors and self.failed:
+            logger.warning('%s failed events written to %s', self.progress.errors, self.failed)
+        return self.progress.errors == 0
+
+    def _drain(self, results, block=False):
+        while True:
+            try:
+                path, offset, error = results.get(block=block, timeout=1 if block else None)
+            except queue.Empty:
+                return
+            self._finish(path, offset, error)
+            block = False
+
+    def _record_failure(self, path, offset, error):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            line = f.readline()
+        logger.error('Failed event in %s at offset %s - %s', path, offset, error)
+        if self._failed_file is not None:
+            self._failed_file.write(line if line.endswith(b'\n') else line + b'\n')
+            self._failed_file.flush()
+            os.fsync(self._failed_file.fileno())
+
+    def _finish(self, path, offset, error):
+        if error is not None:
+            # Written before the checkpoint can move past the line
+            self._record_failure(path, offset, error)
+
+        pending = self.pending[path]
+        finished = self.finished[path]
+        finished.add(offset)
+
+        # Advance the checkpoint over the finished prefix of dispatched lines
+        while pending:
+            first = next(iter(pending))
+            if first not in finished:
+                break
+            self.offsets[path] = pending.pop(first)
+            finished.discard(first)
+
+        self.progress.update(ok=error is None)
+        if time.monotonic() - self._checkpointed >= 5:
+            self._write_checkpoint()
+
+    def _write_checkpoint(self):
+        if self.checkpoint:
+            write_json_atomic(self.checkpoint, self.offsets)
+        self._checkpointed = time.monotonic()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay archived order events into Navision')
+    parser.add_argument('paths', nargs='+', help='JSONL files with one order event per line')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of worker processes')
+    parser.add_argument('--rate', type=float, help='maximum events per second')
+    parser.add_argument('--checkpoint', help='file to resume from and record progress in')
+    parser.add_argument('--queue-size', type=int, default=100, help='events buffered per worker')
+    parser.add_argument('--failed', help='file to append failed events to, by default the checkpoint plus .failed')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    backfill = Backfill(args.paths, args.workers, rate=args.rate, checkpoint=args.checkpoint, queue_size=args.queue_size,
+                        failed=args.failed)
+    return 0 if backfill.run() else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
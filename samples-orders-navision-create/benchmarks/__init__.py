@@ -0,0 +1,6 @@
+"""Offline benchmarks for the order function
+
+Run from the function app root with the usual NAVISION_* settings, e.g.
+
+    python -m samples-orders-navision-create.benchmarks.payload
+"""
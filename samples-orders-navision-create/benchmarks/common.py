@@ -0,0 +1,62 @@
+import ast
+import gc
+import os
+import re
+import time
+import tracemalloc
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'sample.dat')
+
+
+def load_sample_event(path=SAMPLE_PATH):
+    """Loads the EventGrid event in sample.dat, which is a Python-ish literal rather than JSON"""
+
+    with open(path) as f:
+        text = f.read()
+    text = re.sub(r'\bnone\b', 'None', text)
+    text = re.sub(r'\btrue\b', 'True', text)
+    text = re.sub(r'\bfalse\b', 'False', text)
+    return ast.literal_eval(text)
+
+
+def trace_memory(fn):
+    """Returns the peak bytes allocated while running fn and the bytes still held by its result"""
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak, current
+
+
+def measure(fn, min_time=0.5):
+    """Returns ops/sec, peak allocated bytes per op and retained bytes of one result for fn"""
+
+    fn()
+
+    count = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for _ in range(10):
+            fn()
+        count += 10
+        elapsed = time.perf_counter() - start
+
+    peak, current = trace_memory(fn)
+    return {
+        'ops_per_sec': count / elapsed,
+        'alloc_bytes_per_op': peak,
+        'retained_bytes': current,
+    }
+
+
+def print_results(results):
+    width = max(len(name) for name in results)
+    for name, r in results.items():
+        print('%-*s %12.0f ops/s %10.1f KiB/op %10.1f KiB retained' % (
+            width, name, r['ops_per_sec'], r['alloc_bytes_per_op'] / 1024, r['retained_bytes'] / 1024))
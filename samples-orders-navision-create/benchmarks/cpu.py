@@ -0,0 +1,146 @@
+"""CPU microbenchmarks for envelope building and response decoding
+
+    python -m samples-orders-navision-create.benchmarks.cpu --output before.json
+    python -m samples-orders-navision-create.benchmarks.cpu --compare before.json
+
+No network is used: the Navision client talks to an in-memory StubSession.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+
+from lxml import etree
+
+from ..navision import Navision
+from ..order import generate_order_data
+from ..payload import decode_order_event
+from ..response_cache import ResponseCache
+from . import fixtures
+from .common import load_sample_event, measure, print_results
+
+LINE_SIZES = (1, 10, 100, 1000)
+RESPONSE_SIZES = (10, 100, 1000, 10000)
+
+
+def _client(responses):
+    client = Navision('http://navision.invalid/nav', 'user', 'password', order_number_prefix='W')
+    client.session = fixtures.StubSession(responses)
+    return client
+
+
+def benchmarks():
+    """Yields (name, callable) pairs"""
+
+    client = _client({
+        'OrderExists': fixtures.gateway_result('OrderExists', 'true'),
+        'CreateOrder': fixtures.create_order_response(),
+        'UploadSettlement': fixtures.gateway_result('UploadSettlement', ''),
+    })
+
+    event = load_sample_event()
+    for size in LINE_SIZES:
+        event['data']['line_items'] = event['data']['line_items'][:1] * size
+        payload = decode_order_event(event)
+        yield 'generate_order_data[%s]' % size, lambda payload=payload: generate_order_data(payload)
+        order = generate_order_data(payload)
+        yield 'create_order[%s]' % size, lambda order=order: client.create_order(order)
+
+    address = fixtures.address()
+    yield '_build_address', lambda: client._build_address('shipToAddress', address)
+
+    for size in LINE_SIZES:
+        order = fixtures.order(size)
+        refund = fixtures.refund(order)
+        yield '_build_order_lines[%s]' % size, lambda order=order: client._build_order_lines(order)
+        yield '_build_credit_memo_lines[%s]' % size, \
+            lambda order=order, refund=refund: client._build_credit_memo_lines(order, refund)
+
+        soap = client.soap.Envelope(client.soap.Body(client.gateway.CreateOrder(
+            client.gateway.order(client._build_order_lines(order)))))
+        yield 'etree.tostring[%s]' % size, \
+            lambda soap=soap: etree.tostring(soap, encoding="UTF-8", xml_declaration=True)
+
+    order = fixtures.order(1)
+    balance_transaction = fixtures.balance_transaction()
+    yield 'upload_order_settlement_batch', \
+        lambda: client.upload_order_settlement_batch(order, balance_transaction)
+    yield 'upload_fee_settlement_batch', \
+        lambda: client.upload_fee_settlement_batch(balance_transaction)
+
+    soap = client.soap.Envelope(client.soap.Body(client.gateway.OrderExists(client.gateway.orderNo('W1010'))))
+    yield '_bool', lambda: client._bool('OrderExists', soap)
+
+    for size in RESPONSE_SIZES:
+        record = etree.fromstring(fixtures.read_multiple_response(1))[0][0][0][0]
+        for _ in range(size - 1):
+            record.append(etree.fromstring('<Field xmlns="urn:microsoft-dynamics-schemas/page/taxgroup">x</Field>'))
+        yield '_dict[%s]' % size, lambda record=record: client._dict(record)
+
+        doc = etree.fromstring(fixtures.read_multiple_response(size))
+        yield '_list[%s]' % size, lambda doc=doc: client._list(client.tax_group._namespace, 'ReadMultiple_Result', doc)
+
+        responses = {
+            'GetTransactions': fixtures.transactions_response(size),
+            'GetItems': fixtures.items_response(size),
+            'GetCustomers': fixtures.customers_response(size),
+        }
+        # The warm-up run would fill the response cache and leave only hits to measure
+        sized = _client(responses)
+        sized.response_cache = ResponseCache(max_entries=0)
+        yield 'get_transactions[%s]' % size, lambda sized=sized, size=size: sized.get_transactions('US-WEB', 0, size)
+        yield 'get_transactions_columns[%s]' % size, \
+            lambda sized=sized, size=size: sized.get_transactions('US-WEB', 0, size, columns=True)
+        yield 'get_items[%s]' % size, lambda sized=sized: sized.get_items()
+        yield 'get_customers[%s]' % size, lambda sized=sized: sized.get_customers()
+
+        cached = _client(responses)
+        yield 'get_items_cached[%s]' % size, lambda cached=cached: cached.get_items()
+        yield 'get_customers_cached[%s]' % size, lambda cached=cached: cached.get_customers()
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the CPU microbenchmarks')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds to run each benchmark for')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, fn in benchmarks():
+        if args.filter in name:
+            results[name] = measure(fn, min_time=args.min_time)
+    print_results(results)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+        print('\nCompared with %s:' % args.compare)
+        for name, r in results.items():
+            if name in previous:
+                print('%-40s %6.2fx ops/s %6.2fx alloc' % (
+                    name,
+                    r['ops_per_sec'] / previous[name]['ops_per_sec'],
+                    r['alloc_bytes_per_op'] / (previous[name]['alloc_bytes_per_op'] or 1)))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': _commit(),
+                'python': platform.python_version(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Canned NAV responses and dotcom-style order objects for offline benchmarks"""
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from xml.sax.saxutils import escape
+
+GATEWAY_NS = 'urn:microsoft-dynamics-schemas/codeunit/Gateway'
+ENVELOPE = '<Soap:Envelope xmlns:Soap="http://schemas.xmlsoap.org/soap/envelope/"><Soap:Body>%s</Soap:Body></Soap:Envelope>'
+
+
+def _record(tag, ns, fields):
+    return '<%s xmlns="%s">%s</%s>' % (
+        tag, ns, ''.join('<%s>%s</%s>' % (k, escape(str(v)), k) for k, v in fields), tag)
+
+
+def gateway_result(method, value):
+    return ENVELOPE % '<%s_Result xmlns="%s"><return_value>%s</return_value></%s_Result>' % (
+        method, GATEWAY_NS, escape(str(value)), method)
+
+
+def items_response(size):
+    records = ''.join(
+        _record('Item', 'urn:microsoft-dynamics-nav/xmlports/x50001', (
+            ('No', 60000 + i),
+            ('Description', 'Arctis Nova %s Wireless Headset' % i),
+        ))
+        for i in range(size)
+    )
+    return ENVELOPE % '<GetItems_Result xmlns="%s"><items>%s</items></GetItems_Result>' % (GATEWAY_NS, records)
+
+
+def customers_response(size):
+    records = ''.join(
+        _record('Customer', 'urn:microsoft-dynamics-nav/xmlports/x50002', (
+            ('No', 'W%04d' % i),
+            ('Department', 'PROFIT-WEB EMEA'),
+        ))
+        for i in range(size)
+    )
+    return ENVELOPE % '<GetCustomers_Result xmlns="%s"><customers>%s</customers></GetCustomers_Result>' % (
+        GATEWAY_NS, records)
+
+
+def transactions_response(size, after_entry=0):
+    records = ''.join(
+        _record('Transaction', 'urn:microsoft-dynamics-nav/xmlports/x50003', (
+            ('entryNo', after_entry + i + 1),
+            ('DocumentNo', 'SH%06d' % i),
+            ('PostingDate', '%02d/%02d/23' % (1 + i // 28 % 12, 1 + i % 28)),
+            ('ItemNo', 61600 + i % 50),
+            ('EntryType', 'Sale' if i % 3 else 'Transfer'),
+            ('Quantity', '-1,000' if i % 7 == 0 else '-%s' % (1 + i % 5)),
+            ('ExternalDocumentNo', 'W%s' % (1000 + i)),
+        ))
+        for i in range(size)
+    )
+    return ENVELOPE % '<GetTransactions_Result xmlns="%s"><transactions>%s</transactions></GetTransactions_Result>' % (
+        GATEWAY_NS, records)
+
+
+def read_multiple_response(size, namespace='urn:microsoft-dynamics-schemas/page/taxgroup', tag='TaxGroup'):
+    records = ''.join(
+        _record(tag, namespace, (
+            ('Key', '32;GAAAAACLAQAAAAJ7/0kATAAtAFQAWAA%s' % i),
+            ('Code', 'IL-TX%s' % i),
+            ('Description', 'Illinois sales tax %s' % i),
+        ))
+        for i in range(size)
+    )
+    return ENVELOPE % '<ReadMultiple_Result xmlns="%s"><ReadMultiple_Result>%s</ReadMultiple_Result></ReadMultiple_Result>' % (
+        namespace, records)
+
+
+def create_order_response():
+    return ENVELOPE % '<CreateOrder_Result xmlns="%s"/>' % GATEWAY_NS
+
+
+class StubResponse(object):
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.status_code = status_code
+
+
+def response_key(url, soap_action):
+    """Key of the canned response for a request: the SOAP method, prefixed with the page for page methods"""
+
+    method = soap_action.strip('"').rsplit(':', 1)[1]
+    if method in ('ReadMultiple', 'Create'):
+        method = '%s:%s' % (url.rsplit('/', 1)[1], method)
+    return method
+
+
+class StubSession(object):
+    """In-memory stand-in for requests.Session that answers by SOAP method name"""
+
+    def __init__(self, responses):
+        self.responses = responses
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return StubResponse(self.responses[response_key(url, headers['SOAPAction'])])
+
+
+def address():
+    return SimpleNamespace(
+        company=None,
+        name='Customer Customersky',
+        line1='123 Fake Street',
+        line2=None,
+        postcode='60453',
+        city='Oak Lawn',
+        subdivision_id=14,
+        subdivision_short_id='IL',
+        country_id='US',
+    )
+
+
+def order_line(i):
+    return SimpleNamespace(
+        sku=str(61600 + i),
+        name='Arctis Nova %s Wireless Headset - Black' % i,
+        quantity=1 + i % 3,
+        msrp_charge=Decimal('129.99'),
+        total_with_discount_charge=Decimal('119.99'),
+        price=Decimal('129.99'),
+        refund=Decimal('119.99'),
+    )
+
+
+def order(lines):
+    items = [order_line(i) for i in range(lines)]
+    return SimpleNamespace(
+        order_number='1010',
+        type='default',
+        navision_customer='WUS',
+        navision_department='PROFIT-WEB AMERICAS',
+        charge_currency_id='USD',
+        billing_address=address(),
+        shipping_address=address(),
+        customizer_children=[],
+        alacart_items=items,
+        bundle_children=[],
+        shipping_method=SimpleNamespace(name='Ground', msrp_charge=Decimal('9.99'), price_charge=Decimal('0.00')),
+        report_sales_tax=True,
+        sales_tax_by_region=lambda: {'IL': Decimal('12.34'), 'IL-COOK': Decimal('2.10')},
+        country=SimpleNamespace(navision_vat_account_number='25165'),
+    )
+
+
+def refund(order):
+    return SimpleNamespace(
+        items=order.alacart_items,
+        reference='re_3N6yQ2Kx0l7Q1',
+        refunded_at=datetime(2023, 5, 12, 10, 30, tzinfo=timezone.utc),
+        location='US-WEB',
+        reason='RETURN',
+        shipping=Decimal('9.99'),
+        shipping_excluding_sales_tax=Decimal('9.99'),
+        sales_tax=Decimal('14.44'),
+        sales_tax_by_region=lambda: {'IL': Decimal('12.34'), 'IL-COOK': Decimal('2.10')},
+    )
+
+
+def balance_transaction():
+    return SimpleNamespace(
+        timestamp=datetime(2023, 5, 10, 19, 58, tzinfo=timezone.utc),
+        type='payout',
+        description='Payment for order #1010',
+        reference='ch_3N6yQ2Kx0l7Q1',
+        amount_payment=Decimal('141.43'),
+        amount_net=Decimal('137.03'),
+        amount_provider_fee=Decimal('4.40'),
+        payment_currency=SimpleNamespace(id='USD'),
+        balance=SimpleNamespace(
+            balance_currency=SimpleNamespace(id='USD'),
+            account_method='BANK-STRIPE',
+            account_provider_fee='7250',
+            payment_method='stripe',
+            department_fee='HQ-WEB',
+        ),
+    )
@@ -0,0 +1,214 @@
+"""Memory budgets for large orders and bulk reads
+
+    python -m samples-orders-navision-create.benchmarks.memory
+    python -m samples-orders-navision-create.benchmarks.memory --budget 'get_items[10000]=12' --output memory.json
+
+Every scenario runs once to warm caches and once more under tracemalloc,
+recording the peak memory allocated during the call and the memory its
+result still holds. The Navision client talks HTTP to a stand-in NAV
+server in a child process, so the server's own allocations are not counted.
+tracemalloc only sees allocations made through Python, so the memory libxml2
+uses for parsed trees is not included in the numbers. The bulk reads run
+with the response cache off, so they measure parsing; the *_cached
+scenarios measure answering from the cache. A scenario whose peak or
+retained memory goes over its budget makes the run exit with status 1.
+
+Budgets are in MiB. --budgets takes a JSON file of
+{"scenario": {"peak": MiB, "retained": MiB}} and --budget NAME=MiB
+overrides the peak budget of one scenario.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import azure.functions as func
+
+from .. import main as handle_event
+from ..navision import Navision, navision
+from ..order import generate_order_data
+from ..payload import decode_order_event
+from ..response_cache import ResponseCache
+from ..routing import EndpointRouter
+from . import fixtures
+from .common import load_sample_event, trace_memory
+
+RESPONSE_SIZE = 10000
+ORDER_LINES = 5000
+
+MiB = 1024 * 1024
+
+BUDGETS = {
+    'get_items[%s]' % RESPONSE_SIZE: {'peak': 6, 'retained': 4},
+    'get_customers[%s]' % RESPONSE_SIZE: {'peak': 6, 'retained': 4},
+    'get_items_cached[%s]' % RESPONSE_SIZE: {'peak': 4, 'retained': 0.5},
+    'get_transactions[%s]' % RESPONSE_SIZE: {'peak': 12, 'retained': 8},
+    'get_transactions_columns[%s]' % RESPONSE_SIZE: {'peak': 12, 'retained': 4},
+    '_read_multiple[%s]' % RESPONSE_SIZE: {'peak': 12, 'retained': 11},
+    'create_order[%s]' % ORDER_LINES: {'peak': 4, 'retained': 1},
+    'main': {'peak': 1, 'retained': 0.5},
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = self.server.responses.get(fixtures.response_key(self.path, self.headers['SOAPAction']))
+        if body is None:
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(responses, conn):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.responses = {key: text.encode('utf-8') for key, text in responses.items()}
+    conn.send(server.server_address[1])
+    conn.close()
+    server.serve_forever()
+
+
+class StandInServer(object):
+    """Local NAV stand-in that answers SOAP requests with canned responses"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.url = None
+        self._process = None
+
+    def __enter__(self):
+        parent, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(self.responses, child), daemon=True)
+        self._process.start()
+        self.url = 'http://127.0.0.1:%s/nav' % parent.recv()
+        parent.close()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._process.terminate()
+        self._process.join()
+
+
+def _responses():
+    return {
+        # Items 60000 and up, which covers the SKU in sample.dat that the validator in main checks
+        'GetItems': fixtures.items_response(RESPONSE_SIZE),
+        'GetCustomers': fixtures.customers_response(RESPONSE_SIZE),
+        'GetTransactions': fixtures.transactions_response(RESPONSE_SIZE),
+        'TaxGroup:ReadMultiple': fixtures.read_multiple_response(RESPONSE_SIZE),
+        'OrderExists': fixtures.gateway_result('OrderExists', 'false'),
+        'PostedShipmentExists': fixtures.gateway_result('PostedShipmentExists', 'false'),
+        'CreateOrder': fixtures.create_order_response(),
+    }
+
+
+def _events(event):
+    """Yields copies of event with a new event id and order number each, so none is skipped as a duplicate"""
+
+    first = int(time.time() * 1000)
+    for order_number in itertools.count(first):
+        data = dict(event['data'], order_number=order_number)
+        yield func.EventGridEvent(
+            id='memory-%s' % order_number,
+            data=data,
+            topic=event.get('topic', ''),
+            subject=event.get('subject', ''),
+            event_type=event.get('eventType', ''),
+            event_time=None,
+            data_version=event.get('dataVersion', ''),
+        )
+
+
+def scenarios(url):
+    """Yields (name, callable) pairs"""
+
+    client = Navision(url, 'user', 'password', order_number_prefix='W')
+    # The warm-up run would fill the response cache and leave only hits to measure
+    client.response_cache = ResponseCache(max_entries=0)
+    yield 'get_items[%s]' % RESPONSE_SIZE, client.get_items
+    yield 'get_customers[%s]' % RESPONSE_SIZE, client.get_customers
+    yield 'get_transactions[%s]' % RESPONSE_SIZE, lambda: client.get_transactions('US-WEB', 0, RESPONSE_SIZE)
+    yield 'get_transactions_columns[%s]' % RESPONSE_SIZE, \
+        lambda: client.get_transactions('US-WEB', 0, RESPONSE_SIZE, columns=True)
+    yield '_read_multiple[%s]' % RESPONSE_SIZE, lambda: client._read_multiple(client.tax_group, 'Page/TaxGroup', {})
+
+    cached = Navision(url, 'user', 'password', order_number_prefix='W')
+    yield 'get_items_cached[%s]' % RESPONSE_SIZE, cached.get_items
+
+    event = load_sample_event()
+    large = dict(event['data'], line_items=event['data']['line_items'][:1] * ORDER_LINES)
+    order = generate_order_data(decode_order_event(large))
+    yield 'create_order[%s]' % ORDER_LINES, lambda: client.create_order(order)
+
+    # main uses the module singletons, so point them at the stand-in as well
+    navision.router = EndpointRouter([url])
+    navision.base_url = url
+    events = _events(event)
+    yield 'main', lambda: handle_event(next(events))
+
+
+def load_budgets(path=None, overrides=()):
+    budgets = {name: dict(budget) for name, budget in BUDGETS.items()}
+    if path:
+        with open(path) as f:
+            for name, budget in json.load(f).items():
+                budgets.setdefault(name, {}).update(budget)
+    for override in overrides:
+        name, peak = override.rsplit('=', 1)
+        budgets.setdefault(name, {})['peak'] = float(peak)
+    return budgets
+
+
+def check(name, peak, retained, budget):
+    """Returns the budgets that name went over, as strings"""
+
+    over = []
+    for label, used in (('peak', peak), ('retained', retained)):
+        limit = budget.get(label)
+        if limit is not None and used > limit * MiB:
+            over.append('%s %.2f MiB > %.2f MiB' % (label, used / MiB, limit))
+    return over
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check peak and retained memory against per-scenario budgets')
+    parser.add_argument('--filter', default='', help='only run scenarios whose name contains this')
+    parser.add_argument('--budgets', help='JSON file of per-scenario budgets in MiB')
+    parser.add_argument('--budget', action='append', default=[], metavar='NAME=MiB',
+                        help='peak budget for one scenario, may be repeated')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    budgets = load_budgets(args.budgets, args.budget)
+    results = {}
+    failed = False
+    with StandInServer(_responses()) as server:
+        for name, fn in scenarios(server.url):
+            if args.filter not in name:
+                continue
+            fn()
+            peak, retained = trace_memory(fn)
+            over = check(name, peak, retained, budgets.get(name, {}))
+            failed = failed or bool(over)
+            results[name] = {'peak_bytes': peak, 'retained_bytes': retained, 'over_budget': over}
+            print('%-32s %10.1f MiB peak %10.1f MiB retained  %s' % (
+                name, peak / MiB, retained / MiB, '; '.join(over) or 'ok'))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'budgets': budgets, 'results': results}, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
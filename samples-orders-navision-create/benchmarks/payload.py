@@ -0,0 +1,37 @@
+"""Decoding the sample.dat event, on the live EventGrid path and from raw bytes
+
+The functions worker parses the event body before main runs, so on the live
+path event.get_json() hands over a dict that is already built and
+decode_order_event only adds the projection on top of it. The 'live' rows
+measure exactly what main does; the worker's own parse is shown for scale
+and is paid either way. The 'bytes' rows are the path of callers holding raw
+events, such as backfill, where the projection replaces the full parse.
+"""
+import json
+
+import azure.functions as func
+
+from ..payload import decode_order_event
+from .common import load_sample_event, measure, print_results
+
+
+def run():
+    sample = load_sample_event()
+    body = json.dumps(sample).encode('utf-8')
+    event = func.EventGridEvent(
+        id=sample['id'], data=sample['data'], topic=sample.get('topic', ''), subject=sample.get('subject', ''),
+        event_type=sample['eventType'], event_time=None, data_version=sample.get('dataVersion', ''))
+
+    results = {
+        'worker parse (json.loads, not in main)': measure(lambda: json.loads(body)),
+        'live: get_json()': measure(lambda: event.get_json()),
+        'live: decode_order_event(get_json())': measure(lambda: decode_order_event(event.get_json())),
+        'bytes: json.loads (full event)': measure(lambda: json.loads(body)['data']),
+        'bytes: decode_order_event': measure(lambda: decode_order_event(body)),
+    }
+    print_results(results)
+    return results
+
+
+if __name__ == '__main__':
+    run()
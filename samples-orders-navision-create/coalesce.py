@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+
+def timestamp(value):
+    """Seconds since the epoch of an ISO 8601 string such as the payload's updated_at, or None"""
+
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def _older(version, waiting):
+    """Whether an arriving event is older than the waiting one, which it is only if both have a version"""
+
+    return version is not None and waiting is not None and waiting > version
+
+
+class Coalescer(object):
+    """Holds events for a short window and lets only the newest one per order through
+
+    Events are ordered by version (the order's updated_at) when both have one,
+    and by arrival otherwise, so a later event only loses to a waiting one with
+    a higher version. Within one worker a waiting event returns as soon as a
+    newer one for the same order arrives. With a path, the newest event per
+    order is also kept in SQLite so that the workers on a host coalesce with
+    each other; those are compared when the window has passed.
+    """
+
+    def __init__(self, window, path=None):
+        self.window = window
+        self.path = path
+
+        self.newest_by_order = {}
+        self.passed = 0
+        self.superseded = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS newest ('
+                'order_number TEXT PRIMARY KEY, version REAL, token TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._local.db = db
+        return db
+
+    def _offer_shared(self, order_number, version, token):
+        """Records the event as the newest for the host unless a newer one is already waiting"""
+
+        now = time.time()
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                'SELECT version FROM newest WHERE order_number = ? AND expires_at > ?', (order_number, now)
+            ).fetchone()
+            if row is not None and _older(version, row[0]):
+                db.execute('ROLLBACK')
+                return False
+            db.execute(
+                'INSERT OR REPLACE INTO newest (order_number, version, token, expires_at) VALUES (?, ?, ?, ?)',
+                (order_number, version, token, now + self.window * 2)
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return True
+
+    def _take_shared(self, order_number, token):
+        """Removes the event from the store, returning whether it was still the newest"""
+
+        return self._db().execute(
+            'DELETE FROM newest WHERE order_number = ? AND token = ?', (order_number, token)
+        ).rowcount == 1
+
+    def _finish(self, newest):
+        with self._cond:
+            if newest:
+                self.passed += 1
+            else:
+                self.superseded += 1
+        return newest
+
+    def newest(self, order_number, version=None):
+        """Waits out the window and returns whether this is still the newest event for order_number"""
+
+        if self.window <= 0:
+            return True
+
+        order_number = str(order_number)
+        token = uuid.uuid4().hex
+
+        with self._cond:
+            current = self.newest_by_order.get(order_number)
+            if current is not None and _older(version, current[0]):
+                return self._finish(False)
+            self.newest_by_order[order_number] = (version, token)
+            self._cond.notify_all()
+
+        if self.path and not self._offer_shared(order_number, version, token):
+            with self._cond:
+                if self.newest_by_order.get(order_number, (None, None))[1] == token:
+                    del self.newest_by_order[order_number]
+            return self._finish(False)
+
+        deadline = time.monotonic() + self.window
+        superseded = False
+        with self._cond:
+            while True:
+                if self.newest_by_order.get(order_number, (None, None))[1] != token:
+                    superseded = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    del self.newest_by_order[order_number]
+                    break
+                self._cond.wait(remaining)
+
+        if superseded:
+            return self._finish(False)
+        return self._finish(not self.path or self._take_shared(order_number, token))
+
+    def stats(self):
+        with self._cond:
+            return {'passed': self.passed, 'superseded': self.superseded, 'waiting': len(self.newest_by_order)}
+
+
+coalescer = Coalescer(
+    window=float(os.environ.get('NAVISION_COALESCE_WINDOW', '0')),
+    path=os.environ.get('NAVISION_COALESCE_DB') or None,
+)
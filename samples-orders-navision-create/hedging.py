@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .jobs import percentiles
+
+# Gateway methods that only read, so sending one twice is harmless
+READ_ONLY_METHODS = frozenset((
+    'OrderExists',
+    'PostedShipmentExists',
+    'CreditMemoExists',
+    'PostedCreditMemoExists',
+    'FindCreditMemo',
+    'FindPostedCreditMemo',
+    'GetInventory',
+    'GetItems',
+    'GetCustomers',
+    'GetTransactions',
+    'GetUnappliedAmount',
+    'GetAppliedAmount',
+    'ReadMultiple',
+))
+
+
+class Hedger(object):
+    """Sends a second copy of a slow read and takes whichever answer comes first
+
+    A call that has not answered after the given latency percentile of its
+    method is hedged: a duplicate goes out, to another endpoint if there is
+    one and alternate is set. The first successful response wins and the
+    other attempt is cancelled if it has not started, or abandoned if it has.
+    Hedges come out of a budget that grows by budget for every call, so at
+    most that fraction of calls (plus a small burst) is ever sent twice.
+    Methods are not hedged before they have min_samples latencies.
+
+    An abandoned attempt keeps a NAV connection and a pool thread busy after
+    the caller has returned and given up its scheduler slot, so nothing is
+    hedged while one is still running. That keeps the calls beyond the
+    scheduler's cap to the hedges already under way.
+    """
+
+    def __init__(self, percentile=95, budget=0.05, burst=10, alternate=True, methods=READ_ONLY_METHODS,
+                 window=1000, min_samples=50, workers=16):
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.alternate = alternate
+        self.methods = methods
+        self.window = window
+        self.min_samples = min_samples
+
+        self.latencies = {}
+        self.delays = {}
+        self.tokens = float(burst)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.abandoned = 0
+        self.abandoned_running = 0
+        self.saved = 0.0
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+
+    def delay(self, method):
+        """Seconds to wait for a call to method before hedging it, or None if it is not hedged yet"""
+
+        return self.delays.get(method)
+
+    def _observe(self, method, latency):
+        with self._lock:
+            samples = self.latencies.get(method)
+            if samples is None:
+                samples = self.latencies[method] = [deque(maxlen=self.window), 0]
+            samples[0].append(latency)
+            samples[1] += 1
+            # Recomputing the percentile on every call would cost a sort of the window each time
+            if len(samples[0]) >= self.min_samples and samples[1] % 10 == 0:
+                self.delays[method] = percentiles(samples[0], (self.percentile,))[self.percentile]
+
+    def _take_token(self):
+        with self._lock:
+            if self.tokens < 1 or self.abandoned_running:
+                return False
+            self.tokens -= 1
+            self.hedged += 1
+            return True
+
+    def run(self, method, send, choose):
+        """Returns send(target) for a target from choose(exclude), hedging it if it is slow
+
+        send must raise for a failed attempt; the first attempt to return wins.
+        """
+
+        with self._lock:
+            self.calls += 1
+            self.tokens = min(self.burst, self.tokens + self.budget)
+
+        delay = self.delay(method)
+        start = time.monotonic()
+        primary_target = choose(())
+        if delay is None:
+            try:
+                return send(primary_target)
+            finally:
+                self._observe(method, time.monotonic() - start)
+
+        primary = self._pool.submit(send, primary_target)
+        # The latency of the first attempt decides future delays, whether or not it loses
+        primary.add_done_callback(lambda future: self._observe(method, time.monotonic() - start))
+
+        done, _ = wait((primary,), timeout=delay)
+        if done or not self._take_token():
+            return primary.result()
+
+        hedge = self._pool.submit(send, choose((primary_target,)) if self.alternate else primary_target)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        if not loser.cancel():
+                            self._abandon(loser)
+                    if future is hedge:
+                        self._hedge_won(primary, time.monotonic() - start, start)
+                    return future.result()
+        return primary.result()
+
+    def _abandon(self, loser):
+        with self._lock:
+            self.abandoned += 1
+            self.abandoned_running += 1
+
+        def finished(future):
+            with self._lock:
+                self.abandoned_running -= 1
+
+        loser.add_done_callback(finished)
+
+    def _hedge_won(self, primary, won_after, start):
+        with self._lock:
+            self.hedge_wins += 1
+
+        def saved(future):
+            if not future.cancelled() and future.exception() is None:
+                with self._lock:
+                    self.saved += time.monotonic() - start - won_after
+
+        primary.add_done_callback(saved)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'hedge_rate': self.hedged / self.calls if self.calls else 0.0,
+                'hedge_wins': self.hedge_wins,
+                'abandoned': self.abandoned,
+                'abandoned_running': self.abandoned_running,
+                'latency_saved': self.saved,
+                'delays': dict(self.delays),
+            }
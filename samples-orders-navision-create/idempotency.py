@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = 'in_progress'
+COMPLETED = 'completed'
+
+Claim = namedtuple('Claim', 'keys token')
+
+
+class ClaimInProgress(Exception):
+    """Raised when keys are leased to another invocation that has not finished yet"""
+
+    def __init__(self, keys):
+        super().__init__('Keys are in progress elsewhere: %s' % ', '.join(keys))
+        self.keys = keys
+
+
+class BloomFilter(object):
+    """In-process Bloom filter over string keys"""
+
+    def __init__(self, size=1 << 20, hashes=4):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray(size // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8 * self.hashes).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[i * 8:(i + 1) * 8], 'little') % self.size
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def clear(self):
+        self.bits = bytearray(self.size // 8)
+
+
+class IdempotencyStore(object):
+    """Host-wide record of claimed and completed keys, shared by worker processes through SQLite (WAL)
+
+    The first worker to claim a set of keys gets a short lease; completed keys
+    are remembered for ttl seconds. The lease must be shorter than the host's
+    functionTimeout, so that the claim of an invocation the host killed has
+    expired by the time EventGrid redelivers the event, and longer than an
+    invocation is allowed to run (see INVOCATION_BUDGET in __init__), so that
+    a live claim is never taken over. A per-process Bloom filter of completed
+    keys answers most redeliveries without a write transaction.
+    """
+
+    purge_every = 1000
+
+    def __init__(self, path, lease=240, ttl=86400):
+        self.path = path
+        self.lease = lease
+        self.ttl = ttl
+
+        self.bloom = BloomFilter()
+        self._bloom_reset_at = time.time() + ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._claims = 0
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS claims ('
+                'key TEXT PRIMARY KEY, state TEXT NOT NULL, token TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._local.db = db
+        return db
+
+    def _completed(self, keys, now):
+        """Checks keys against the Bloom filter and confirms any hit in the store"""
+
+        if now > self._bloom_reset_at:
+            with self._lock:
+                self.bloom.clear()
+                self._bloom_reset_at = now + self.ttl
+
+        maybe = [key for key in keys if key in self.bloom]
+        if not maybe:
+            return False
+
+        rows = self._db().execute(
+            'SELECT 1 FROM claims WHERE state = ? AND expires_at > ? AND key IN (%s)' % ','.join('?' * len(maybe)),
+            [COMPLETED, now] + maybe
+        ).fetchall()
+        return bool(rows)
+
+    def completed(self, keys):
+        """Whether any of keys is completed, without claiming them
+
+        Unlike claim, this reads the store even when the Bloom filter misses,
+        since keys completed by other workers are not in this one's filter.
+        """
+
+        keys = [str(key) for key in keys]
+        rows = self._db().execute(
+            'SELECT key FROM claims WHERE state = ? AND expires_at > ? AND key IN (%s)' % ','.join('?' * len(keys)),
+            [COMPLETED, time.time()] + keys
+        ).fetchall()
+        for key, in rows:
+            self.bloom.add(key)
+        return bool(rows)
+
+    def claim(self, keys):
+        """Claims keys for this worker, returning a Claim or None if any key is completed
+
+        Raises ClaimInProgress if a key is leased to another invocation, so the
+        event fails and is redelivered instead of being acknowledged.
+        """
+
+        keys = tuple(str(key) for key in keys)
+        now = time.time()
+        if self._completed(keys, now):
+            return None
+
+        token = uuid.uuid4().hex
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            taken = db.execute(
+                'SELECT key, state FROM claims WHERE expires_at > ? AND key IN (%s)' % ','.join('?' * len(keys)),
+                (now,) + keys
+            ).fetchall()
+            if taken:
+                db.execute('ROLLBACK')
+            else:
+                db.executemany(
+                    'INSERT OR REPLACE INTO claims (key, state, token, expires_at) VALUES (?, ?, ?, ?)',
+                    [(key, IN_PROGRESS, token, now + self.lease) for key in keys]
+                )
+                db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+        if taken:
+            completed = [key for key, state in taken if state == COMPLETED]
+            for key in completed:
+                self.bloom.add(key)
+            if completed:
+                return None
+            raise ClaimInProgress(tuple(key for key, state in taken))
+
+        self._claims += 1
+        if self._claims % self.purge_every == 0:
+            self.purge()
+
+        return Claim(keys=keys, token=token)
+
+    def complete(self, claim):
+        """Marks claimed keys as completed for ttl seconds, returning False if the claim had been lost"""
+
+        updated = self._db().execute(
+            'UPDATE claims SET state = ?, expires_at = ? WHERE token = ? AND key IN (%s)' % ','.join('?' * len(claim.keys)),
+            (COMPLETED, time.time() + self.ttl, claim.token) + claim.keys
+        ).rowcount
+        for key in claim.keys:
+            self.bloom.add(key)
+        if updated < len(claim.keys):
+            # The lease ran out and a redelivery took the keys over, so it may be doing the same work
+            logger.error('Claim on %s was lost before it completed (lease %ss)', ', '.join(claim.keys), self.lease)
+            return False
+        return True
+
+    def release(self, claim):
+        """Gives up a claim so that a redelivery can retry it"""
+
+        self._db().execute(
+            'DELETE FROM claims WHERE token = ? AND key IN (%s)' % ','.join('?' * len(claim.keys)),
+            (claim.token,) + claim.keys
+        )
+
+    def purge(self):
+        deleted = self._db().execute('DELETE FROM claims WHERE expires_at <= ?', (time.time(),)).rowcount
+        logger.info('Purged %s expired idempotency keys', deleted)
+
+
+idempotency = IdempotencyStore(
+    path=os.environ.get('NAVISION_IDEMPOTENCY_DB', os.path.join(tempfile.gettempdir(), 'navision-idempotency.sqlite3')),
+    lease=int(os.environ.get('NAVISION_IDEMPOTENCY_LEASE', '240')),
+    ttl=int(os.environ.get('NAVISION_IDEMPOTENCY_TTL', '86400')),
+)
@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from .jobs import write_json_atomic
+from .navision import navision
+from .scheduler import BULK
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryView(object):
+    """Per (location, SKU) stock levels maintained locally from the NAV item ledger
+
+    The view replays get_transactions in entry_number order, so the ledger
+    sum per location and SKU is the stock level. Queries are answered from
+    memory as long as the location was synced within the requested
+    staleness bound. A background thread, started by the first sync, checks
+    the known SKUs of each location against get_inventory every
+    reconcile_every seconds and corrects any drift.
+    """
+
+    def __init__(self, client, path=None, max_staleness=60, reconcile_every=86400, page_size=1000):
+        self.client = client
+        self.path = path
+        self.max_staleness = max_staleness
+        self.reconcile_every = reconcile_every
+        self.page_size = page_size
+
+        self.stock = {}
+        self.last_entry = {}
+        self.synced_at = {}
+        self.reconciled_at = {}
+        # (location, sku) -> entry_number of the last ledger entry applied to it
+        self.touched = {}
+        self._lock = threading.RLock()
+        self._reconciler = None
+
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path) as f:
+            state = json.load(f)
+        self.stock = {(location, sku): quantity for location, sku, quantity in state['stock']}
+        self.last_entry = state['last_entry']
+        self.synced_at = state['synced_at']
+        self.reconciled_at = state['reconciled_at']
+
+    def _save(self):
+        if not self.path:
+            return
+        write_json_atomic(self.path, {
+            'stock': [[location, sku, quantity] for (location, sku), quantity in self.stock.items()],
+            'last_entry': self.last_entry,
+            'synced_at': self.synced_at,
+            'reconciled_at': self.reconciled_at,
+        })
+
+    def age(self, location):
+        """Seconds since location was last synced, or None if it never was"""
+
+        synced_at = self.synced_at.get(location)
+        return None if synced_at is None else time.time() - synced_at
+
+    def sync(self, location, max_staleness=None):
+        """Applies ledger entries after the last applied one, in entry_number order
+
+        With max_staleness, does nothing if the location was synced within that
+        many seconds, which it may have been by a caller holding the view first.
+        """
+
+        with self._lock:
+            if max_staleness is not None:
+                age = self.age(location)
+                if age is not None and age <= max_staleness:
+                    return
+
+            last_entry = self.last_entry.get(location, 0)
+            applied = 0
+            while True:
+                after = last_entry
+                page = self.client.get_transaction_page(location, last_entry, self.page_size)
+                for transaction in sorted(page.transactions, key=lambda t: t.entry_number):
+                    if transaction.entry_number <= last_entry:
+                        continue
+                    key = (location, transaction.sku)
+                    self.stock[key] = self.stock.get(key, 0) + transaction.quantity
+                    self.touched[key] = transaction.entry_number
+                    last_entry = transaction.entry_number
+                    applied += 1
+                # Entries the decoder dropped still count for paging, or a short page would end the sync early
+                last_entry = max(last_entry, page.last_entry)
+                if page.entries < self.page_size or last_entry <= after:
+                    break
+
+            self.last_entry[location] = last_entry
+            self.synced_at[location] = time.time()
+            logger.info('Applied %s ledger entries for %s up to entry %s', applied, location, last_entry)
+
+            # A full replay from the first entry is as good as a reconcile
+            self.reconciled_at.setdefault(location, time.time())
+            self._save()
+        self._start_reconciler()
+
+    def reconcile(self, location, skus=None):
+        """Corrects local stock for skus (default: every SKU seen at location) from get_inventory
+
+        The live levels are read without holding the view, so entries may be
+        posted while they are collected. A SKU with ledger entries after the
+        watermark (the last entry applied before reading) may or may not have
+        them in its live level, so it is left for the next reconcile; every
+        other SKU is at the watermark both locally and in NAV.
+        """
+
+        with self._lock:
+            watermark = self.last_entry.get(location, 0)
+            if skus is None:
+                skus = [sku for (loc, sku) in self.stock if loc == location]
+
+        with self.client.priority(BULK):
+            live = {sku: self.client.get_inventory(location, sku) for sku in skus}
+
+        with self._lock:
+            # Apply what was posted meanwhile, so the watermark check sees it
+            self.sync(location)
+            skipped = 0
+            for sku, quantity in live.items():
+                key = (location, sku)
+                if self.touched.get(key, 0) > watermark:
+                    skipped += 1
+                    continue
+                local = self.stock.get(key, 0)
+                if quantity != local:
+                    logger.warning('Inventory drift for %s at %s: local=%s navision=%s', sku, location, local, quantity)
+                    self.stock[key] = quantity
+            if skipped:
+                logger.info('Left %s SKUs at %s that moved during the reconcile for next time', skipped, location)
+            self.reconciled_at[location] = time.time()
+            self._save()
+
+    def _start_reconciler(self):
+        if self._reconciler is not None or not self.reconcile_every:
+            return
+        with self._lock:
+            if self._reconciler is None:
+                self._reconciler = threading.Thread(target=self._reconcile_due, name='inventory-reconcile', daemon=True)
+                self._reconciler.start()
+
+    def _reconcile_due(self):
+        while True:
+            for location, reconciled_at in list(self.reconciled_at.items()):
+                if time.time() - reconciled_at >= self.reconcile_every:
+                    try:
+                        self.reconcile(location)
+                    except Exception:
+                        logger.exception('Could not reconcile inventory of %s', location)
+            time.sleep(min(self.reconcile_every, 60))
+
+    def get_inventory(self, location, sku, max_staleness=None):
+        """Returns stock for sku at location, syncing first if the view is older than max_staleness seconds"""
+
+        if max_staleness is None:
+            max_staleness = self.max_staleness
+        age = self.age(location)
+        if age is None or age > max_staleness:
+            # Concurrent queries of a stale location wait for one sync instead of each making their own
+            self.sync(location, max_staleness)
+        return self.stock.get((location, sku), 0)
+
+
+inventory = InventoryView(
+    navision,
+    path=os.environ.get('NAVISION_INVENTORY_PATH'),
+    max_staleness=int(os.environ.get('NAVISION_INVENTORY_MAX_STALENESS', '60')),
+    reconcile_every=int(os.environ.get('NAVISION_INVENTORY_RECONCILE_EVERY', '86400')),
+)
@@ -0,0 +1,94 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+
+class Progress(object):
+    """Prints live throughput and error counts for a long running job"""
+
+    def __init__(self, label, interval=1.0, stream=None):
+        self.label = label
+        self.interval = interval
+        self.stream = stream or sys.stderr
+
+        self.done = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self._printed = self.started
+        self._printed_done = 0
+        self._lock = threading.Lock()
+
+    def update(self, ok=True):
+        with self._lock:
+            self.done += 1
+            if not ok:
+                self.errors += 1
+            now = time.monotonic()
+            if now - self._printed >= self.interval:
+                self._print(now)
+
+    def _print(self, now, final=False):
+        elapsed = now - self.started
+        if final:
+            rate = self.done / elapsed if elapsed else 0.0
+        else:
+            rate = (self.done - self._printed_done) / (now - self._printed)
+        self.stream.write('%s: %s done, %s errors, %.1f/s, %.0fs elapsed%s\n' % (
+            self.label, self.done, self.errors, rate, elapsed, ' (finished)' if final else ''))
+        self.stream.flush()
+        self._printed = now
+        self._printed_done = self.done
+
+    def finish(self):
+        with self._lock:
+            self._print(time.monotonic(), final=True)
+
+
+def write_json_atomic(path, obj):
+    tmp = '%s.tmp' % path
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+class Checkpoint(object):
+    """Append-only file of completed keys, so a rerun skips work that is already done"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        self._file = None
+
+        if path:
+            if os.path.exists(path):
+                with open(path) as f:
+                    self.done = set(line.strip() for line in f if line.strip())
+            self._file = open(path, 'a')
+
+    def __contains__(self, key):
+        return str(key) in self.done
+
+    def add(self, key):
+        key = str(key)
+        with self._lock:
+            self.done.add(key)
+            if self._file is not None:
+                self._file.write(key + '\n')
+                self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Nearest-rank percentiles of values, as {point: value}"""
+
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    return {p: ordered[max(0, math.ceil(p / 100.0 * len(ordered)) - 1)] for p in points}
@@ -0,0 +1,168 @@
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+
+
+def lane_for(key, lanes):
+    return zlib.crc32(str(key).encode('utf-8')) % lanes
+
+
+class _Lane(object):
+    def __init__(self, index, queue_size):
+        self.index = index
+        self.tasks = queue.Queue(queue_size)
+        self.submitted = 0
+        self.spilled = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        # When the item the lane is running started, None while it waits for work
+        self.running_since = None
+        self.thread = None
+
+
+class LaneExecutor(object):
+    """Runs work in parallel lanes, keeping the work for one key in submission order
+
+    Each lane runs its work one item at a time on its own thread. While a key
+    (an order number) has work queued or running, more work for it goes to
+    the same lane, so the calls for one order never overlap or reorder. A key
+    with nothing in flight goes to the lane with the least outstanding work,
+    so one slow order does not hold up the orders that happen to hash behind
+    it. A lane buffers at most queue_size items; submit blocks while the lane
+    it needs is full. A failed item does not stop the lane, its exception is
+    set on the Future that submit returned.
+    """
+
+    def __init__(self, lanes, queue_size=100, name='lane'):
+        self.lanes = [_Lane(i, queue_size) for i in range(lanes)]
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        # key -> [lane, items queued or running], for keys with work in flight
+        self._in_flight = {}
+        self._shutdown = False
+        for lane in self.lanes:
+            lane.thread = threading.Thread(target=self._run, args=(lane,), name='%s-%s' % (name, lane.index), daemon=True)
+            lane.thread.start()
+
+    def _run(self, lane):
+        while True:
+            task = lane.tasks.get()
+            with self._space:
+                self._space.notify_all()
+            if task is None:
+                return
+            key, future, fn, args, kwargs = task
+
+            start = lane.running_since = time.monotonic()
+            failed = False
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                    failed = True
+                else:
+                    future.set_result(result)
+            with self._space:
+                lane.busy += time.monotonic() - start
+                lane.running_since = None
+                lane.completed += 1
+                if failed:
+                    lane.failed += 1
+                in_flight = self._in_flight[key]
+                in_flight[1] -= 1
+                if not in_flight[1]:
+                    del self._in_flight[key]
+                self._space.notify_all()
+
+    def _lane_for(self, key):
+        """The lane work for key has to go to, or None while that lane is full"""
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            lane = in_flight[0]
+            return None if lane.tasks.full() else lane
+
+        home = self.lanes[lane_for(key, len(self.lanes))]
+        lanes = [lane for lane in self.lanes if not lane.tasks.full()]
+        if not lanes:
+            return None
+        # Least outstanding work first, then the lane whose current item started last, as the one
+        # that started first is the likeliest to be stuck, then the hashed lane
+        now = time.monotonic()
+        return min(lanes, key=lambda lane: (
+            lane.submitted - lane.completed, -(lane.running_since or now), lane is not home))
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) on a lane for key, waiting while the lane it needs is full"""
+
+        if self._shutdown:
+            raise RuntimeError('Cannot submit to a LaneExecutor after shutdown')
+        key = str(key)
+        future = Future()
+
+        start = time.monotonic()
+        with self._space:
+            lane = self._lane_for(key)
+            while lane is None:
+                self._space.wait()
+                if self._shutdown:
+                    raise RuntimeError('Cannot submit to a LaneExecutor after shutdown')
+                lane = self._lane_for(key)
+            # Only submitters put and they hold the lock, so the lane still has room
+            lane.tasks.put_nowait((key, future, fn, args, kwargs))
+            self._in_flight.setdefault(key, [lane, 0])[1] += 1
+
+            lane.blocked += time.monotonic() - start
+            lane.submitted += 1
+            if lane is not self.lanes[lane_for(key, len(self.lanes))]:
+                lane.spilled += 1
+            lane.max_depth = max(lane.max_depth, lane.tasks.qsize())
+        return future
+
+    def shutdown(self, wait=True):
+        if not self._shutdown:
+            with self._space:
+                self._shutdown = True
+                self._space.notify_all()
+            for lane in self.lanes:
+                lane.tasks.put(None)
+        if wait:
+            for lane in self.lanes:
+                lane.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def imbalance(self):
+        """Submissions to the busiest lane over the mean per lane; 1.0 is perfectly even"""
+
+        with self._lock:
+            submitted = [lane.submitted for lane in self.lanes]
+        total = sum(submitted)
+        return max(submitted) * len(submitted) / total if total else 1.0
+
+    def stats(self):
+        with self._lock:
+            lanes = [
+                {
+                    'submitted': lane.submitted,
+                    'spilled': lane.spilled,
+                    'completed': lane.completed,
+                    'failed': lane.failed,
+                    'queued': lane.tasks.qsize(),
+                    'max_depth': lane.max_depth,
+                    'busy': lane.busy,
+                    'blocked': lane.blocked,
+                }
+                for lane in self.lanes
+            ]
+        return {'lanes': lanes, 'imbalance': self.imbalance()}
@@ -0,0 +1,247 @@
+"""Local append-only columnar archive of the NAV item ledger
+
+    python -m samples-orders-navision-create.ledger_archive sync ledger/ US-WEB EU-WEB
+    python -m samples-orders-navision-create.ledger_archive report ledger/ --location US-WEB \\
+        --from 2023-05-01 --to 2023-05-31 --by sku
+
+An archive is a directory with one raw little-endian file per column
+(entry number, posting date, location, SKU, entry type, quantity and
+external document number) and meta.json, which records the committed row
+count and the last entry archived per location. Strings are interned: the
+columns hold ids into append-only vocabulary files. Rows past the
+committed count, left by an interrupted append, are cut off on open.
+
+Readers get the columns as read-only memory-mapped NumPy arrays, so
+reports over millions of entries are vectorized and load nothing from NAV.
+"""
+import argparse
+import json
+import os
+from datetime import date
+
+import numpy as np
+
+from .jobs import write_json_atomic
+from .navision import navision
+from .scheduler import BULK
+
+COLUMNS = {
+    'entry_number': np.dtype('<i8'),
+    'date': np.dtype('<i4'),
+    'location': np.dtype('<i4'),
+    'sku': np.dtype('<i4'),
+    'type': np.dtype('<i4'),
+    'quantity': np.dtype('<i8'),
+    'external_document_number': np.dtype('<i4'),
+}
+
+VOCABULARIES = ('location', 'sku', 'type', 'external_document_number')
+
+
+class _Vocabulary(object):
+    """Strings interned to ids, kept in an append-only file of one string per line"""
+
+    def __init__(self, path):
+        self.path = path
+        self.values = []
+        self.ids = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    self.ids.setdefault(line.rstrip('\n'), len(self.values))
+                    self.values.append(line.rstrip('\n'))
+        self._new = []
+
+    def id(self, value):
+        value = '' if value is None else value.replace('\n', ' ')
+        i = self.ids.get(value)
+        if i is None:
+            i = self.ids[value] = len(self.values)
+            self.values.append(value)
+            self._new.append(value)
+        return i
+
+    def flush(self):
+        if self._new:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.writelines('%s\n' % value for value in self._new)
+                f.flush()
+                os.fsync(f.fileno())
+            self._new = []
+
+
+class LedgerArchive(object):
+    """Item ledger entries of any number of locations, archived in entry_number order per location"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        self.meta = {'rows': 0, 'last_entry': {}}
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+
+        self.vocabularies = {name: _Vocabulary(os.path.join(path, '%s.txt' % name)) for name in VOCABULARIES}
+        self._columns = None
+
+        # Drop the tail of an append that never got committed to meta.json
+        for name, dtype in COLUMNS.items():
+            column_path = self._column_path(name)
+            size = self.meta['rows'] * dtype.itemsize
+            if not os.path.exists(column_path):
+                open(column_path, 'wb').close()
+            if os.path.getsize(column_path) > size:
+                os.truncate(column_path, size)
+
+    def _column_path(self, name):
+        return os.path.join(self.path, '%s.bin' % name)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def last_entry(self, location):
+        return self.meta['last_entry'].get(location, 0)
+
+    def append(self, location, transactions, through_entry=None):
+        """Archives transactions of location newer than its last archived entry, returning how many
+
+        through_entry moves the location's last entry on to at least that entry
+        number, past entries NAV sent that could not be decoded.
+        """
+
+        last_entry = self.last_entry(location)
+        rows = sorted((t for t in transactions if t.entry_number > last_entry), key=lambda t: t.entry_number)
+        if not rows:
+            if through_entry is not None and through_entry > last_entry:
+                self.meta['last_entry'][location] = through_entry
+                write_json_atomic(os.path.join(self.path, 'meta.json'), self.meta)
+            return 0
+
+        vocabularies = self.vocabularies
+        location_id = vocabularies['location'].id(location)
+        values = {
+            'entry_number': [t.entry_number for t in rows],
+            'date': [t.date.toordinal() for t in rows],
+            'location': [location_id] * len(rows),
+            'sku': [vocabularies['sku'].id(t.sku) for t in rows],
+            'type': [vocabularies['type'].id(t.type) for t in rows],
+            'quantity': [t.quantity for t in rows],
+            'external_document_number': [vocabularies['external_document_number'].id(t.external_document_number)
+                                         for t in rows],
+        }
+        for vocabulary in vocabularies.values():
+            vocabulary.flush()
+        for name, dtype in COLUMNS.items():
+            with open(self._column_path(name), 'ab') as f:
+                f.write(np.asarray(values[name], dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.meta['rows'] += len(rows)
+        self.meta['last_entry'][location] = max(rows[-1].entry_number, through_entry or 0)
+        write_json_atomic(os.path.join(self.path, 'meta.json'), self.meta)
+        self._columns = None
+        return len(rows)
+
+    def sync(self, client, location, page_size=1000):
+        """Archives the ledger entries of location that NAV has after the last archived one"""
+
+        appended = 0
+        while True:
+            after = self.last_entry(location)
+            page = client.get_transaction_page(location, after, page_size, columns=True)
+            appended += self.append(location, page.transactions, through_entry=page.last_entry)
+            # A page can decode short when entries are dropped, so stop on what NAV sent
+            if page.entries < page_size or self.last_entry(location) <= after:
+                return appended
+
+    def columns(self):
+        """The committed columns as read-only memory-mapped arrays, by name"""
+
+        if self._columns is None:
+            rows = self.meta['rows']
+            self._columns = {
+                name: np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=(rows,))
+                if rows else np.empty(0, dtype=dtype)
+                for name, dtype in COLUMNS.items()
+            }
+        return self._columns
+
+    def _mask(self, location=None, sku=None, start=None, end=None, types=None):
+        """Rows matching every given filter; start and end are inclusive dates"""
+
+        columns = self.columns()
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in (('location', location), ('sku', sku)):
+            if value is not None:
+                mask &= columns[name] == self.vocabularies[name].ids.get(value, -1)
+        if start is not None:
+            mask &= columns['date'] >= start.toordinal()
+        if end is not None:
+            mask &= columns['date'] <= end.toordinal()
+        if types is not None:
+            ids = [self.vocabularies['type'].ids.get(t, -1) for t in types]
+            mask &= np.isin(columns['type'], ids)
+        return mask
+
+    def _sum_by(self, name, mask):
+        values = self.vocabularies[name].values
+        ids = self.columns()[name][mask]
+        totals = np.bincount(ids, weights=self.columns()['quantity'][mask], minlength=len(values))
+        present = np.bincount(ids, minlength=len(values)) > 0
+        return {values[i]: int(totals[i]) for i in np.flatnonzero(present)}
+
+    def quantity_by_sku(self, location=None, start=None, end=None, types=None):
+        return self._sum_by('sku', self._mask(location=location, start=start, end=end, types=types))
+
+    def quantity_by_location(self, sku=None, start=None, end=None, types=None):
+        return self._sum_by('location', self._mask(sku=sku, start=start, end=end, types=types))
+
+    def quantity_by_date(self, location=None, sku=None, start=None, end=None, types=None):
+        mask = self._mask(location=location, sku=sku, start=start, end=end, types=types)
+        days, inverse = np.unique(self.columns()['date'][mask], return_inverse=True)
+        totals = np.bincount(inverse, weights=self.columns()['quantity'][mask], minlength=len(days))
+        return {date.fromordinal(int(day)): int(total) for day, total in zip(days, totals)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Archive the NAV item ledger locally and report on it')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sync = commands.add_parser('sync', help='archive new ledger entries from NAV')
+    sync.add_argument('path', help='archive directory')
+    sync.add_argument('locations', nargs='+')
+    sync.add_argument('--page-size', type=int, default=1000)
+
+    report = commands.add_parser('report', help='print quantities summed over the archive')
+    report.add_argument('path', help='archive directory')
+    report.add_argument('--by', choices=('sku', 'location', 'date'), default='sku')
+    report.add_argument('--location')
+    report.add_argument('--sku')
+    report.add_argument('--from', dest='start', type=date.fromisoformat)
+    report.add_argument('--to', dest='end', type=date.fromisoformat)
+    report.add_argument('--type', dest='types', action='append', help='entry type, may be repeated')
+    args = parser.parse_args(argv)
+
+    archive = LedgerArchive(args.path)
+    if args.command == 'sync':
+        with navision.priority(BULK):
+            for location in args.locations:
+                print('%s: %s entries archived' % (location, archive.sync(navision, location, args.page_size)))
+        return 0
+
+    if args.by == 'sku':
+        totals = archive.quantity_by_sku(args.location, args.start, args.end, args.types)
+    elif args.by == 'location':
+        totals = archive.quantity_by_location(args.sku, args.start, args.end, args.types)
+    else:
+        totals = archive.quantity_by_date(args.location, args.sku, args.start, args.end, args.types)
+    for key, quantity in sorted(totals.items()):
+        print('%s\t%s' % (key, quantity))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
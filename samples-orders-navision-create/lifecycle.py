@@ -0,0 +1,140 @@
+"""Posts or cancels a batch of orders in Navision
+
+    python -m samples-orders-navision-create.lifecycle post shipped.txt --posting-date 2023-05-31 \\
+        --workers 4 --checkpoint post.done --report post.csv
+    cat cancelled.txt | python -m samples-orders-navision-create.lifecycle cancel -
+
+Order numbers are read one per line from files or stdin and handled by a
+pool of workers, partitioned by order number so that repeats of one order
+run in sequence. Orders with a posted shipment are skipped. Orders
+that were posted, cancelled or skipped go into the checkpoint file, so a
+rerun only retries failures and orders it has not reached yet.
+"""
+import argparse
+import csv
+import fileinput
+import logging
+import threading
+import time
+from datetime import date
+
+from .jobs import Checkpoint, Progress, percentiles
+from .lanes import LaneExecutor
+from .navision import navision
+from .scheduler import BULK
+
+logger = logging.getLogger(__name__)
+
+POSTED = 'posted'
+CANCELLED = 'cancelled'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+class LifecycleJob(object):
+    def __init__(self, action, posting_date=None, workers=4, checkpoint=None, report=None, client=navision):
+        if action == 'post' and posting_date is None:
+            raise ValueError('Posting orders requires a posting date')
+        self.action = action
+        self.posting_date = posting_date
+        self.workers = workers
+        self.checkpoint = Checkpoint(checkpoint)
+        self.client = client
+
+        self.report = None
+        self._report_file = None
+        if report:
+            self._report_file = open(report, 'w', newline='')
+            self.report = csv.writer(self._report_file)
+            self.report.writerow(('order_number', 'action', 'outcome', 'seconds', 'error'))
+
+        self.timings = []
+        self.outcomes = {}
+        self.imbalance = 1.0
+        self.progress = Progress(action)
+        self._lock = threading.Lock()
+
+    def _handle(self, order_number):
+        if self.client.posted_shipment_exists(order_number):
+            return SKIPPED
+        if self.action == 'post':
+            return POSTED if self.client.post_order(order_number, self.posting_date) else FAILED
+        return CANCELLED if self.client.cancel_order(order_number) else FAILED
+
+    def _run_one(self, order_number):
+        start = time.monotonic()
+        error = ''
+        try:
+            with self.client.priority(BULK):
+                outcome = self._handle(order_number)
+        except Exception as e:
+            logger.exception('Could not %s order %s', self.action, order_number)
+            outcome = FAILED
+            error = repr(e)
+        seconds = time.monotonic() - start
+
+        if outcome != FAILED:
+            self.checkpoint.add(order_number)
+        with self._lock:
+            self.timings.append(seconds)
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if self.report is not None:
+                self.report.writerow((order_number, self.action, outcome, '%.3f' % seconds, error))
+        self.progress.update(ok=outcome != FAILED)
+
+    def run(self, order_numbers):
+        # Small lane queues bound the orders in flight, so a long stream is not read into memory up front
+        with LaneExecutor(self.workers, queue_size=2, name=self.action) as lanes:
+            for order_number in order_numbers:
+                if order_number in self.checkpoint:
+                    continue
+                lanes.submit(order_number, self._run_one, order_number)
+        self.imbalance = lanes.imbalance()
+
+        self.checkpoint.close()
+        if self._report_file is not None:
+            self._report_file.close()
+        self.progress.finish()
+        return self.outcomes.get(FAILED, 0) == 0
+
+    def summary(self):
+        timings = percentiles(self.timings, (50, 90, 99, 100))
+        return '%s: %s; p50=%.3fs p90=%.3fs p99=%.3fs max=%.3fs; lane imbalance %.2f' % (
+            self.action,
+            ', '.join('%s=%s' % item for item in sorted(self.outcomes.items())) or 'nothing to do',
+            timings.get(50, 0), timings.get(90, 0), timings.get(99, 0), timings.get(100, 0),
+            self.imbalance,
+        )
+
+
+def read_order_numbers(paths):
+    with fileinput.input(paths) as lines:
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Post or cancel orders in Navision in bulk')
+    parser.add_argument('action', choices=('post', 'cancel'))
+    parser.add_argument('paths', nargs='+', help="files with one order number per line, or - for stdin")
+    parser.add_argument('--posting-date', type=date.fromisoformat, help='posting date (YYYY-MM-DD) for post')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent Navision calls')
+    parser.add_argument('--checkpoint', help='file of finished order numbers to skip and append to')
+    parser.add_argument('--report', help='CSV file for the per-order outcomes')
+    args = parser.parse_args(argv)
+
+    if args.action == 'post' and args.posting_date is None:
+        parser.error('post requires --posting-date')
+
+    logging.basicConfig(level=logging.WARNING)
+    job = LifecycleJob(args.action, args.posting_date, workers=args.workers,
+                       checkpoint=args.checkpoint, report=args.report)
+    ok = job.run(read_order_numbers(args.paths))
+    print(job.summary())
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
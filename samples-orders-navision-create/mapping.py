@@ -0,0 +1,114 @@
+"""Declarative record mappings compiled into plain Python functions
+
+A mapping describes how to build a namedtuple from a source object:
+
+    ADDRESS = Record('shipping_address', NavAddress, {
+        'name': Field('name', default=''),
+        'country_id': Field('country_code', transform=str.upper),
+        ...
+    })
+
+compile_mapping generates the source of a single function that reads every
+field with attribute access and builds the records with tuple.__new__, so
+mapping a payload does no per-field lookups in the spec at runtime.
+"""
+
+
+class Field(object):
+    """Value at the first truthy of one or more dotted source paths, else default, optionally transformed
+
+    The empty path '' is the source object itself.
+    """
+
+    def __init__(self, *sources, transform=None, default=None):
+        self.sources = sources
+        self.transform = transform
+        self.default = default
+
+
+class Record(object):
+    """A cls record built from the object at source, or None if there is no such object"""
+
+    def __init__(self, source, cls, fields):
+        self.source = source
+        self.cls = cls
+        self.fields = fields
+
+
+class Each(object):
+    """A tuple of cls records, one for every element of the list at source"""
+
+    def __init__(self, source, cls, fields):
+        self.source = source
+        self.cls = cls
+        self.fields = fields
+
+
+class _Compiler(object):
+    def __init__(self):
+        self.constants = {}
+        self.counter = 0
+
+    def name(self, prefix):
+        self.counter += 1
+        return '_%s%d' % (prefix, self.counter)
+
+    def constant(self, value):
+        name = self.name('c')
+        self.constants[name] = value
+        return name
+
+    def path(self, base, path):
+        if not path:
+            return base
+        attrs = path.split('.')
+        expr = '%s.%s' % (base, attrs[0])
+        for attr in attrs[1:]:
+            tmp = self.name('t')
+            expr = '(None if (%s := %s) is None else %s.%s)' % (tmp, expr, tmp, attr)
+        return expr
+
+    def rule(self, base, rule):
+        if isinstance(rule, Record):
+            tmp = self.name('t')
+            return '(None if (%s := %s) is None else %s)' % (
+                tmp, self.path(base, rule.source), self.record(tmp, rule.cls, rule.fields))
+
+        if isinstance(rule, Each):
+            item = self.name('i')
+            return 'tuple([%s for %s in (%s or ())])' % (
+                self.record(item, rule.cls, rule.fields), item, self.path(base, rule.source))
+
+        if not isinstance(rule, Field):
+            return self.constant(rule)
+
+        exprs = [self.path(base, source) for source in rule.sources]
+        if rule.default is not None:
+            exprs.append(self.constant(rule.default))
+        expr = exprs[0] if len(exprs) == 1 else '(%s)' % ' or '.join(exprs)
+        if rule.transform is not None:
+            expr = '%s(%s)' % (self.constant(rule.transform), expr)
+        return expr
+
+    def record(self, base, cls, fields):
+        missing = set(cls._fields) - set(fields)
+        unknown = set(fields) - set(cls._fields)
+        if missing or unknown:
+            raise ValueError('Mapping for %s is missing %s and has unknown %s' % (
+                cls.__name__, sorted(missing), sorted(unknown)))
+        values = ', '.join(self.rule(base, fields[field]) for field in cls._fields)
+        return '_new(%s, (%s,))' % (self.constant(cls), values)
+
+
+def compile_mapping(cls, fields, name='map_record'):
+    """Compiles a mapping from a source object to a cls namedtuple into a function"""
+
+    compiler = _Compiler()
+    body = compiler.record('source', cls, fields)
+    source = 'def %s(source):\n    return %s\n' % (name, body)
+
+    namespace = dict(compiler.constants, _new=tuple.__new__)
+    exec(compile(source, '<mapping %s>' % name, 'exec'), namespace)
+    function = namespace[name]
+    function.source = source
+    return function
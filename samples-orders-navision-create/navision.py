@@ -4,10 +4,15 @@ import re
 import os
 import dateparser
 import json
+import time
+from array import array
 from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import date as datetime_date
-from datetime import datetime
+from datetime import datetime, timezone
 from decimal import Decimal
+from functools import lru_cache
 from typing import Union
 from zoneinfo import ZoneInfo
 
@@ -17,6 +22,12 @@ import requests_ntlm
 from lxml import etree
 from lxml.builder import ElementMaker
 
+from .hedging import Hedger
+from .profiling import record_call
+from .response_cache import ResponseCache, digest
+from .routing import EndpointRouter
+from .scheduler import BACKGROUND, BULK, INTERACTIVE, PriorityScheduler, SlotTimeout, default_reservations
+
 logger = logging.getLogger(__name__)
 
 VAT_CODES = json.load(open('vat_codes.json'))
@@ -26,6 +37,151 @@ VAT_CODES = json.load(open('vat_codes.json'))
 Transaction = namedtuple('Transaction', 'document_number entry_number date sku type quantity external_document_number')
 Item = namedtuple('Item', 'sku name')
 Customer = namedtuple('Customer', 'no department')
+# Decoded transactions of one GetTransactions call, with the number of entries NAV sent and the highest
+# entry number among them, which may belong to an entry the decoder dropped
+TransactionPage = namedtuple('TransactionPage', 'transactions entries last_entry')
+
+
+def _copy_records(records):
+    return [dict(record) for record in records]
+
+
+class TransactionColumns(object):
+    """Transactions stored column-wise, with entry numbers and quantities in int64 arrays
+
+    Indexing and iterating give Transaction tuples. Repeated SKUs and entry
+    types share one string object.
+    """
+
+    __slots__ = ('document_numbers', 'entry_numbers', 'dates', 'skus', 'types', 'quantities',
+                 'external_document_numbers', '_strings')
+
+    def __init__(self):
+        self.document_numbers = []
+        self.entry_numbers = array('q')
+        self.dates = []
+        self.skus = []
+        self.types = []
+        self.quantities = array('q')
+        self.external_document_numbers = []
+        self._strings = {}
+
+    def append(self, transaction):
+        strings = self._strings
+        self.document_numbers.append(transaction.document_number)
+        self.entry_numbers.append(transaction.entry_number)
+        self.dates.append(transaction.date)
+        self.skus.append(strings.setdefault(transaction.sku, transaction.sku))
+        self.types.append(strings.setdefault(transaction.type, transaction.type))
+        self.quantities.append(transaction.quantity)
+        self.external_document_numbers.append(transaction.external_document_number)
+
+    def __len__(self):
+        return len(self.entry_numbers)
+
+    def __getitem__(self, i):
+        return Transaction(self.document_numbers[i], self.entry_numbers[i], self.dates[i], self.skus[i],
+                           self.types[i], self.quantities[i], self.external_document_numbers[i])
+
+    def __iter__(self):
+        return map(Transaction, self.document_numbers, self.entry_numbers, self.dates, self.skus,
+                   self.types, self.quantities, self.external_document_numbers)
+
+
+# Position in Transaction of each GetTransactions child element, by local name
+TRANSACTION_FIELDS = {
+    'DocumentNo': 0,
+    'entryNo': 1,
+    'PostingDate': 2,
+    'ItemNo': 3,
+    'EntryType': 4,
+    'Quantity': 5,
+    'ExternalDocumentNo': 6,
+}
+
+# Same, by namespaced tag, filled in as tags are seen; -1 for children that are not used
+_transaction_tags = {}
+
+
+@lru_cache(maxsize=4096)
+def _posting_date(value):
+    return datetime.strptime(value, '%m/%d/%y').date()
+
+
+@lru_cache(maxsize=64)
+def _entry_type(value):
+    return value.lower()
+
+
+def decode_transactions(entries, into=None):
+    """Decodes GetTransactions ledger entries into a list of Transactions, or appends them to into"""
+
+    transactions = [] if into is None else into
+    append = transactions.append
+    tags = _transaction_tags
+    new = tuple.__new__
+
+    for entry in entries:
+        values = [None, None, None, None, None, '0', None]
+        for child in entry:
+            index = tags.get(child.tag)
+            if index is None:
+                index = tags[child.tag] = TRANSACTION_FIELDS.get(child.tag.rpartition('}')[2], -1)
+            if index >= 0:
+                values[index] = child.text
+
+        document_number, entry_number, posting_date, sku, entry_type, quantity, external = values
+        if entry_number == '0':
+            continue
+
+        try:
+            append(new(Transaction, (
+                document_number,
+                int(entry_number),
+                _posting_date(posting_date),
+                sku,
+                _entry_type(entry_type),
+                int(quantity.replace(',', '') if ',' in quantity else quantity),
+                external,
+            )))
+        except ValueError:
+            logger.error(
+                "Navision transfer has invalid quantity: entryNo[%s] quantity[%s]" % (entry_number, quantity)
+            )
+
+    return transactions
+
+
+# Priority class of each SOAP method, unless overridden with Navision.priority()
+PRIORITIES = {
+    'GetItems': BULK,
+    'GetCustomers': BULK,
+    'GetTransactions': BULK,
+    'ReadMultiple': BULK,
+    'Create': BACKGROUND,
+    'UploadSettlement': BACKGROUND,
+    'ClearSettlements': BACKGROUND,
+    'PostSettlement': BACKGROUND,
+    'GetUnappliedAmount': BACKGROUND,
+    'GetAppliedAmount': BACKGROUND,
+}
+
+_priority = ContextVar('navision_priority', default=None)
+_deadline = ContextVar('navision_deadline', default=None)
+
+
+class Deadline(object):
+    """A point in time by which a chain of Navision calls has to be done"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def __repr__(self):
+        return 'Deadline(%.1fs of %.1fs left)' % (self.remaining(), self.seconds)
 
 
 # Client
@@ -34,12 +190,34 @@ class Navision(object):
     timeout = 120
     tz = ZoneInfo('Europe/Copenhagen')
 
-    def __init__(self, url, username, password, order_number_prefix=''):
-        self.base_url = url.rstrip('/')
+    # Statuses that say the service tier itself is unhealthy, rather than a SOAP fault
+    unhealthy_status_codes = (502, 503, 504)
+
+    # Called with the mapped order and then the rendered order element before CreateOrder is sent,
+    # see validation.py
+    validator = None
+
+    # Calls are not started with less than this many seconds left before the deadline
+    min_call_time = 1.0
+
+    def __init__(self, url, username, password, order_number_prefix='', concurrency=8,
+                 hedge_percentile=None, hedge_budget=0.05, hedge_alternate=True):
+        urls = [url] if isinstance(url, str) else list(url)
+        self.router = EndpointRouter([u.strip().rstrip('/') for u in urls])
+        self.base_url = self.router.endpoints[0].url
+        self.scheduler = PriorityScheduler(concurrency, default_reservations(concurrency))
         self.username = username
         self.password = password
+        self.response_cache = ResponseCache()
+        # Read-only calls slower than this percentile of their method get a second copy sent, see hedging.py
+        self.hedger = None
+        if hedge_percentile:
+            self.hedger = Hedger(hedge_percentile, hedge_budget, alternate=hedge_alternate, workers=concurrency * 2)
 
         self.auth = requests_ntlm.HttpNtlmAuth(self.username, self.password)
+        # NTLM authenticates connections, so keeping them pooled saves a handshake per call
+        self.session = requests.Session()
+        self.session.auth = self.auth
         self.soap = ElementMaker(
             namespace="http://schemas.xmlsoap.org/soap/envelope/",
             nsmap={'SOAP-ENV': "http://schemas.xmlsoap.org/soap/envelope/"}
@@ -61,12 +239,75 @@ class Navision(object):
         
         return dt.strftime(format_string).replace('T00:00:00', '')
 
-    def _url(self, endpoint):
-        return '{}/{}'.format(self.base_url, endpoint.lstrip('/'))
-
-    def _request(self, method, soap, endpoint=None):
+    def _formatted_date(self, value, format_string="%m-%d-%Y"):
+        if isinstance(value, str):
+            return self._format_date(value, format_string)
+        if isinstance(value, datetime):
+            value = self._localize_date(value)
+        return value.strftime(format_string)
+
+    def _localize_date(self, value):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(self.tz)
+
+    @contextmanager
+    def priority(self, cls):
+        """Runs the calls made in this context (thread or task) in priority class cls"""
+
+        token = _priority.set(cls)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+    @contextmanager
+    def deadline(self, deadline):
+        """Runs the calls made in this context within deadline, a Deadline or None for no deadline
+
+        Each call waits for a slot and for NAV for at most the time that is left,
+        and raises DeadlineExceeded instead of starting with less than
+        min_call_time left.
+        """
+
+        token = _deadline.set(deadline)
+        try:
+            yield
+        finally:
+            _deadline.reset(token)
+
+    def _time_left(self, method, deadline):
+        if deadline is None:
+            return self.timeout
+        remaining = deadline.remaining()
+        if remaining < self.min_call_time:
+            raise DeadlineExceeded(method, deadline)
+        return min(self.timeout, remaining)
+
+    def _url(self, endpoint, base_url=None):
+        return '{}/{}'.format(base_url or self.base_url, endpoint.lstrip('/'))
+
+    def _request(self, method, soap, endpoint=None, key=None):
+        return etree.fromstring(self._post(method, soap, endpoint=endpoint, key=key).content)
+
+    def _cached(self, method, soap, parse, endpoint=None, request_key=None, copy=list):
+        """Sends a bulk read and decodes it with parse, unless the response bytes match the cached ones
+
+        Callers get copy(result), so changing what they get back does not change the cache.
+        """
+
+        r = self._post(method, soap, endpoint=endpoint)
+        cache_key = (method, endpoint, request_key)
+        content_digest = digest(r.content)
+        result = self.response_cache.get(cache_key, content_digest)
+        if result is None:
+            start = time.perf_counter()
+            result = parse(etree.fromstring(r.content))
+            self.response_cache.put(cache_key, content_digest, result, time.perf_counter() - start)
+        return copy(result)
+
+    def _post(self, method, soap, endpoint=None, key=None):
         endpoint = endpoint or 'Codeunit/Gateway'
-        url = self._url(endpoint)
         headers = {
             'Content-Type': 'text/xml; charset=utf-8',
             'SOAPAction': '"urn:microsoft-dynamics-schemas/codeunit/Gateway:%s"' % method
@@ -74,13 +315,55 @@ class Navision(object):
         data = etree.tostring(soap, encoding="UTF-8", xml_declaration=True)
 
         logger.info("Navision request - method=%s, headers=%s, data=%s", method, headers, data)
-        r = requests.post(url, headers=headers, data=data, auth=self.auth, timeout=self.timeout)
-        logger.info("Navision response - status_code=%s, text=%s", r.status_code, r.text)
+        cls = _priority.get()
+        if cls is None:
+            cls = PRIORITIES.get(method, INTERACTIVE)
+        deadline = _deadline.get()
+        called = time.monotonic()
+        try:
+            with self.scheduler.slot(cls, timeout=None if deadline is None else self._time_left(method, deadline)):
+                timeout = self._time_left(method, deadline)
+
+                def send(target):
+                    return self._send(method, target, endpoint, headers, data, timeout, deadline)
+
+                if self.hedger is not None and method in self.hedger.methods:
+                    # A hedge goes to another endpoint without moving the key's sticky one
+                    def choose(exclude):
+                        return self.router.choose(None if exclude else key, exclude)
+
+                    r = self.hedger.run(method, send, choose)
+                else:
+                    r = send(self.router.choose(key))
+        except SlotTimeout:
+            # No slot came free before the deadline; socket timeouts, which are TimeoutErrors too, propagate
+            raise DeadlineExceeded(method, deadline)
+        finally:
+            record_call(method, time.monotonic() - called)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Navision response - status_code=%s, text=%s", r.status_code, r.text)
 
         if r.status_code != 200:
-            raise NavisionError(r.text)
-
-        return etree.fromstring(r.text)
+            raise fault_error(method, r.status_code, r.text)
+
+        return r
+
+    def _send(self, method, target, endpoint, headers, data, timeout, deadline):
+        url = self._url(endpoint, target.url)
+        start = time.monotonic()
+        try:
+            r = self.session.post(url, headers=headers, data=data, timeout=timeout)
+        except requests.Timeout:
+            # Running out of deadline says nothing about the endpoint
+            if timeout < self.timeout:
+                raise DeadlineExceeded(method, deadline)
+            self.router.record(target, time.monotonic() - start, ok=False)
+            raise
+        except requests.RequestException:
+            self.router.record(target, time.monotonic() - start, ok=False)
+            raise
+        self.router.record(target, time.monotonic() - start, ok=r.status_code not in self.unhealthy_status_codes)
+        return r
 
     def _create(self, page, object_type, endpoint, obj):
         attributes = []
@@ -100,8 +383,8 @@ class Navision(object):
         result = doc.find('*//%sCreate_Result' % page._namespace)[0]
         return self._dict(result)
 
-    def _bool(self, method, soap, endpoint=None):
-        doc = self._request(method, soap, endpoint=endpoint)
+    def _bool(self, method, soap, endpoint=None, key=None):
+        doc = self._request(method, soap, endpoint=endpoint, key=key)
         result = doc.find('*//{urn:microsoft-dynamics-schemas/codeunit/Gateway}%s_Result' % method)[0]
         return result.text == 'true'
 
@@ -147,8 +430,11 @@ class Navision(object):
                 page.ReadMultiple(*filter_soap),
             )
         )
-        doc = self._request('ReadMultiple', soap, endpoint)
-        return self._list(page._namespace, 'ReadMultiple_Result', doc)
+        return self._cached(
+            'ReadMultiple', soap,
+            lambda doc: self._list(page._namespace, 'ReadMultiple_Result', doc),
+            endpoint=endpoint, request_key=tuple(filters.items()), copy=_copy_records,
+        )
 
     def _read_single(self, page, endpoint, filters):
         groups = self._read_multiple(page, endpoint, filters)
@@ -157,6 +443,18 @@ class Navision(object):
                                 (len(groups), endpoint, filters))
         return groups[0]
 
+    def routing_stats(self):
+        return self.router.stats()
+
+    def scheduler_stats(self):
+        return self.scheduler.stats()
+
+    def response_cache_stats(self):
+        return self.response_cache.stats()
+
+    def hedging_stats(self):
+        return self.hedger.stats() if self.hedger is not None else None
+
     # Customers
 
     def get_customers(self):
@@ -167,8 +465,9 @@ class Navision(object):
                 )
             )
         )
-        doc = self._request('GetCustomers', soap)
+        return self._cached('GetCustomers', soap, self._customers)
 
+    def _customers(self, doc):
         customers = []
         entries = doc.find('*//{urn:microsoft-dynamics-schemas/codeunit/Gateway}customers')
         for entry in entries:
@@ -187,8 +486,9 @@ class Navision(object):
                 )
             )
         )
-        doc = self._request('GetItems', soap)
+        return self._cached('GetItems', soap, self._items)
 
+    def _items(self, doc):
         items = []
         entries = doc.find('*//{urn:microsoft-dynamics-schemas/codeunit/Gateway}items')
         for entry in entries:
@@ -212,7 +512,16 @@ class Navision(object):
         result = doc.find('*//{urn:microsoft-dynamics-schemas/codeunit/Gateway}GetInventory_Result')[0]
         return int(result.text)
 
-    def get_transactions(self, location, after_entry, num_entries=50):
+    def get_transactions(self, location, after_entry, num_entries=50, columns=False):
+        return self.get_transaction_page(location, after_entry, num_entries, columns).transactions
+
+    def get_transaction_page(self, location, after_entry, num_entries=50, columns=False):
+        """Like get_transactions, for callers that page through the ledger
+
+        A page can decode to fewer transactions than NAV sent, so paging has to
+        stop on page.entries and resume after page.last_entry.
+        """
+
         soap = self.soap.Envelope(
             self.soap.Body(
                 self.gateway.GetTransactions(
@@ -225,34 +534,10 @@ class Navision(object):
         )
         doc = self._request('GetTransactions', soap)
 
-        # parse it
-        transactions = []
         entries = doc.find('*//{urn:microsoft-dynamics-schemas/codeunit/Gateway}transactions')
-        for entry in entries:
-            values = dict([(re.sub(r'{.+}', '', i.tag), i.text) for i in entry])
-            if values.get('entryNo') == '0':
-                continue
-
-            try:
-                trans = Transaction(
-                    document_number=values.get('DocumentNo'),
-                    entry_number=int(values.get('entryNo')),
-                    date=datetime.strptime(values.get('PostingDate'), '%m/%d/%y').date(),
-                    sku=values.get('ItemNo'),
-                    type=values.get('EntryType').lower(),
-                    quantity=int(values.get('Quantity', '0').replace(',', '')),
-                    external_document_number=values.get('ExternalDocumentNo')
-                )
-                transactions.append(trans)
-            except ValueError:
-                logger.error(
-                    "Navision transfer has invalid quantity: entryNo[%s] quantity[%s]" % (
-                        values.get('entryNo'),
-                        values.get('Quantity')
-                    )
-                )
-
-        return transactions
+        transactions = decode_transactions(entries, TransactionColumns() if columns else None)
+        entry_numbers = [int(n) for n in entries.xpath('*/*[local-name()="entryNo"]/text()')]
+        return TransactionPage(transactions, len(entries), max(entry_numbers, default=after_entry))
 
     # Orders
 
@@ -264,7 +549,7 @@ class Navision(object):
                 )
             )
         )
-        return self._bool('OrderExists', soap)
+        return self._bool('OrderExists', soap, key=order_number)
 
     def posted_shipment_exists(self, order_number):
         soap = self.soap.Envelope(
@@ -274,41 +559,49 @@ class Navision(object):
                 )
             )
         )
-        return self._bool('PostedShipmentExists', soap)
+        return self._bool('PostedShipmentExists', soap, key=order_number)
 
-    def create_order(self, order_data):
+    def create_order(self, order):
         e = ElementMaker()
 
-        order_date = self._format_date(order_data["created_at"])
+        order_date = self._format_date(order.created_at)
+
+        country_code = order.shipping_address.country_id
+        if country_code not in VAT_CODES:
+            raise OrderValidationError(order.order_number, ['no VAT code for country %s' % country_code])
+        if self.validator is not None:
+            self.validator.validate_order(order)
+
+        order_element = self.gateway.order(
+            e.header(
+                e.orderNo("%s%s" % (self.order_number_prefix, order.order_number)),
+                e.externalDocNo(order.order_number),
+                e.sellToCustomerNo(order.navision_customer),
+                e.department(order.navision_department),
+                e.genBusPostingGroup(""),
+                e.vatBusPostingGroup(VAT_CODES[country_code] or ""),
+                e.internalComment(""),
+                e.orderDate(order_date),
+                e.currency(order.charge_currency_id),
+                e.paymentTermsCode(order.payment_terms_code),
+                e.locationCode(order.location_code),
+                e.phoneNo(order.phone_number),
+                e.email(order.email),
+                e.yourReference(order.your_reference)
+            ),
+            self._build_address('billToAddress', order.billing_address),
+            self._build_address('shipToAddress', order.shipping_address),
+            self._build_order_lines(order),
+        )
+        if self.validator is not None:
+            self.validator.validate(order_element)
 
         soap = self.soap.Envelope(
             self.soap.Body(
-                self.gateway.CreateOrder(
-                    self.gateway.order(
-                        e.header(
-                            e.orderNo("%s%s" % (self.order_number_prefix, order_data["order_number"])),
-                            e.externalDocNo(order_data["order_number"]),
-                            e.sellToCustomerNo(order_data["customer"]["id"]),
-                            e.department(order_data["navision_department"]),
-                            e.genBusPostingGroup(""),
-                            e.vatBusPostingGroup(VAT_CODES[order_data["shipping_address"]["country_code"]] or ""),
-                            e.internalComment(""),
-                            e.orderDate(order_date),
-                            e.currency(order_data["charge_currency_id"]),
-                            e.paymentTermsCode(order.get_payment_method_instance().navision_code),
-                            e.locationCode(order_data["location_code"]),
-                            e.phoneNo(order_data[""]),
-                            e.email(order_data[""]),
-                            e.yourReference(order.payment.reference or order.order_number)
-                        ),
-                        self._build_address('billToAddress', order.billing_address),
-                        self._build_address('shipToAddress', order.shipping_address),
-                        self._build_order_lines(order),
-                    )
-                )
+                self.gateway.CreateOrder(order_element)
             )
         )
-        return self._request('CreateOrder', soap)
+        return self._request('CreateOrder', soap, key=order.order_number)
 
     def _build_address(self, elem, address):
         e = ElementMaker()
@@ -390,7 +683,7 @@ class Navision(object):
                 )
             )
         )
-        return self._bool('CancelOrder', soap)
+        return self._bool('CancelOrder', soap, key=order_number)
 
     def post_order(self, order_number, date):
         formatted_date = self._formatted_date(date, format_string='%Y-%m-%d')
@@ -404,7 +697,7 @@ class Navision(object):
                 )
             )
         )
-        return self._bool('PostOrder', soap)
+        return self._bool('PostOrder', soap, key=order_number)
 
     # Credit Memos
 
@@ -478,7 +771,7 @@ class Navision(object):
                 )
             )
         )
-        doc = self._request('CreateCreditMemo', soap)
+        doc = self._request('CreateCreditMemo', soap, key=order.order_number)
 
         # find credit memo number
         return doc.find('*//{urn:microsoft-dynamics-nav/xmlports/x50012}cmNo').text
@@ -844,9 +1137,77 @@ class NavisionError(Exception):
     pass
 
 
+class NavisionFault(NavisionError):
+    """A SOAP fault returned by NAV for a method"""
+
+    def __init__(self, method, faultcode, faultstring, status_code=500):
+        super().__init__(faultstring)
+        self.method = method
+        self.faultcode = faultcode
+        self.faultstring = faultstring
+        self.status_code = status_code
+
+
+class DuplicateRecordError(NavisionFault):
+    """NAV refused to insert a record because its primary key is already taken"""
+
+
+class DuplicateOrderError(DuplicateRecordError):
+    """CreateOrder was refused because NAV already has an order with that number"""
+
+
+# Fault classes by (methods or None for any method, pattern searched in "faultcode faultstring"),
+# first match wins
+FAULTS = [
+    (('CreateOrder',), re.compile(r'RecordAlreadyExists|already exists', re.IGNORECASE), DuplicateOrderError),
+    (None, re.compile(r'RecordAlreadyExists|already exists', re.IGNORECASE), DuplicateRecordError),
+]
+
+
+def fault_error(method, status_code, text):
+    """The NavisionError for a failed response, a NavisionFault subclass if the body is a SOAP fault"""
+
+    try:
+        doc = etree.fromstring(text.encode('utf-8'))
+    except etree.XMLSyntaxError:
+        return NavisionError(text)
+    fault = doc.find('{http://schemas.xmlsoap.org/soap/envelope/}Body/{http://schemas.xmlsoap.org/soap/envelope/}Fault')
+    if fault is None:
+        return NavisionError(text)
+
+    faultcode = fault.findtext('faultcode', '')
+    faultstring = fault.findtext('faultstring', '')
+    for methods, pattern, cls in FAULTS:
+        if (methods is None or method in methods) and pattern.search('%s %s' % (faultcode, faultstring)):
+            return cls(method, faultcode, faultstring, status_code)
+    return NavisionFault(method, faultcode, faultstring, status_code)
+
+
+class DeadlineExceeded(NavisionError):
+    """A call was not started, or was cut short, because its deadline had (almost) passed"""
+
+    def __init__(self, method, deadline):
+        super().__init__('%s not completed within %s' % (method, deadline))
+        self.method = method
+        self.deadline = deadline
+
+
+class OrderValidationError(NavisionError):
+    """An order that was rejected locally and will fail the same way if retried"""
+
+    def __init__(self, order_number, problems):
+        super().__init__('Order %s is invalid: %s' % (order_number, '; '.join(problems)))
+        self.order_number = order_number
+        self.problems = problems
+
+
 navision = Navision(
-    url=os.environ["NAVISION_URL"],
+    url=os.environ["NAVISION_URL"].split(','),
     username=os.environ["NAVISION_USERNAME"],
     password=os.environ["NAVISION_PASSWORD"],
     order_number_prefix=os.environ["NAVISION_ORDER_NUMBER_PREFIX"],
+    concurrency=int(os.environ.get("NAVISION_CONCURRENCY", "8")),
+    hedge_percentile=float(os.environ.get("NAVISION_HEDGE_PERCENTILE", "0")) or None,
+    hedge_budget=float(os.environ.get("NAVISION_HEDGE_BUDGET", "0.05")),
+    hedge_alternate=os.environ.get("NAVISION_HEDGE_ALTERNATE", "true").lower() in ('1', 'true', 'yes'),
 )
@@ -1,40 +1,117 @@
-from typing import TypeVar
+import os
+from collections import namedtuple
+from decimal import Decimal
 
-
-from .schema import OrderEventPayload
-from .navision import navision
 from .country_vat import vat_dicts
+from .mapping import Each, Field, Record, compile_mapping
+from .navision import OrderValidationError
+from .schema import OrderEventPayload
 
-T = TypeVar('T')
+NavAddress = namedtuple('NavAddress', (
+    'company', 'name', 'line1', 'line2', 'postcode', 'city',
+    'subdivision_id', 'subdivision_short_id', 'country_id'))
 
+NavOrderLine = namedtuple('NavOrderLine', ('sku', 'name', 'quantity', 'msrp_charge', 'total_with_discount_charge'))
 
-def generate_order_data(payload: OrderEventPayload) -> dict:
-    """Generates order data for NAV from OrderEventPayload"""
+ShippingMethod = namedtuple('ShippingMethod', ('name', 'msrp_charge', 'price_charge'))
+
+
+class NavOrder(namedtuple('NavOrder', (
+        'order_number', 'created_at', 'navision_customer', 'navision_department', 'charge_currency_id',
+        'payment_terms_code', 'location_code', 'phone_number', 'email', 'your_reference', 'country',
+        'billing_address', 'shipping_address', 'alacart_items', 'shipping_method',
+        'report_sales_tax', 'sales_tax'))):
+    """Order in the shape navision.create_order serializes"""
+
+    __slots__ = ()
+
+    # Shopify has no customizer or bundle lines, every line item is posted as an alacart item
+    customizer_children = ()
+    bundle_children = ()
+
+    def sales_tax_by_region(self):
+        return self.sales_tax
+
+
+def _country_vat(country_code):
+    return vat_dicts.get(country_code.upper()) if country_code else None
+
+
+def _vat_field(name):
+    return lambda country_code: getattr(_country_vat(country_code), name, None)
 
-    order = {}
-    order["created_at"] = payload["created_at"]
-    order["order_number_prefix"] = navision.order_number_prefix
-    order["order_number"] = payload["order_number"]
-    
-    vat_dict = vat_dicts[payload["country_code"].upper()]
-    order["navision_customer"] = vat_dict.navision_customer
-    order["navision_department"] = vat_dict.navision_department
-    order["navision_vat_business_group"] = vat_dict.navision_vat_business_group
-    order["charge_currency_id"] = payload["currency".upper()]
-    
-    
-    order["payment_terms_code"] = 'TODO' # TODO
+
+def _line_total(line):
+    return Decimal(line.price) * line.quantity - Decimal(line.total_discount or 0)
+
+
+def _shipping_method(shipping_lines):
+    return ShippingMethod(
+        shipping_lines[0].title[:30] if shipping_lines and shipping_lines[0].title else 'Shipping',
+        sum((Decimal(line.price) for line in shipping_lines), Decimal(0)),
+        sum((Decimal(line.discounted_price or line.price) for line in shipping_lines), Decimal(0)),
+    )
+
+
+def _sales_tax(payload):
+    tax = sum((Decimal(line.price) for line in payload.tax_lines or ()), Decimal(0))
+    if not tax:
+        return {}
+    address = payload.shipping_address or payload.billing_address
+    return {(address.province_code or '').upper() if address else '': tax}
+
+
+ADDRESS = {
+    'company': Field('company'),
+    'name': Field('name', default=''),
+    'line1': Field('address1', default=''),
+    'line2': Field('address2'),
+    'postcode': Field('zip'),
+    'city': Field('city'),
+    'subdivision_id': Field('province_code'),
+    'subdivision_short_id': Field('province_code', default='', transform=str.upper),
+    'country_id': Field('country_code', default='', transform=str.upper),
+}
+
+ORDER_LINE = {
+    'sku': Field('sku'),
+    'name': Field('name', default=''),
+    'quantity': Field('quantity'),
+    'msrp_charge': Field('price', transform=Decimal),
+    'total_with_discount_charge': Field('', transform=_line_total),
+}
+
+ORDER = {
+    'order_number': Field('order_number', transform=str),
+    'created_at': Field('created_at'),
+    'navision_customer': Field('country_code', transform=_vat_field('navision_customer')),
+    'navision_department': Field('country_code', transform=_vat_field('navision_department')),
+    'charge_currency_id': Field('currency', transform=str.upper),
     # See aggregates.py in dotcom to reference:  order.get_payment_method_instance().navision_code)
-    
-    order["location_code"] = 'TODO' # TODO
+    'payment_terms_code': os.environ.get("NAVISION_PAYMENT_TERMS_CODE", ''),
     # See aggregates.py in dotcom to reference:  order.warehouse.location_code, maybe reference payload["customer_locale"]?
-    
-    order["phone_number"] = payload["phone"]
-    order["email"] = payload["email"]
-    order["your_reference"] = payload["reference"] or payload["order_number"]
+    'location_code': os.environ.get("NAVISION_LOCATION_CODE", ''),
+    'phone_number': Field('phone', default=''),
+    'email': Field('email', 'customer.email', default=''),
+    'your_reference': Field('reference', 'order_number', transform=str),
+    'country': Field('country_code', transform=_country_vat),
+    'billing_address': Record('billing_address', NavAddress, ADDRESS),
+    'shipping_address': Record('shipping_address', NavAddress, ADDRESS),
+    'alacart_items': Each('line_items', NavOrderLine, ORDER_LINE),
+    'shipping_method': Field('shipping_lines', default=(), transform=_shipping_method),
+    'report_sales_tax': Field('country_code', transform=lambda country_code: (country_code or '').upper() == 'US'),
+    'sales_tax': Field('', transform=_sales_tax),
+}
 
-    # TODO: BUILD ADDRESS BILL TO
-    # TODO: BUILD ADDRESS SHIP TO
-    # TODO: BUILD ORDER LINES
+map_order = compile_mapping(NavOrder, ORDER, 'map_order')
+
+
+def generate_order_data(payload: OrderEventPayload) -> NavOrder:
+    """Generates order data for NAV from OrderEventPayload"""
 
+    order = map_order(payload)
+    if order.country is None:
+        raise OrderValidationError(order.order_number, ['unknown country %s' % payload["country_code"]])
+    if order.billing_address is None or order.shipping_address is None:
+        raise OrderValidationError(order.order_number, ['order has no billing or shipping address'])
     return order
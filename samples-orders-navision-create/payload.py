@@ -0,0 +1,98 @@
+import json
+from collections.abc import Mapping
+from typing import Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .schema import (
+    AddressPayload, CustomerPayload, LineItemPayload, OrderEventPayload, ShippingLinePayload, TaxLinePayload
+)
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+class Projection(object):
+    """Slotted view holding only the fields declared by a payload TypedDict"""
+
+    __slots__ = ()
+    nested = {}
+
+    def __init__(self, source):
+        nested = self.nested
+        for field in self.__slots__:
+            value = source.get(field)
+            if value is not None and field in nested:
+                projection = nested[field]
+                if isinstance(value, list):
+                    value = [projection(v) for v in value]
+                else:
+                    value = projection(value)
+            setattr(self, field, value)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        return '%s(%s)' % (
+            type(self).__name__,
+            ', '.join('%s=%r' % (field, getattr(self, field)) for field in self.__slots__)
+        )
+
+
+class Address(Projection):
+    __slots__ = tuple(AddressPayload.__annotations__)
+
+
+class Customer(Projection):
+    __slots__ = tuple(CustomerPayload.__annotations__)
+
+
+class TaxLine(Projection):
+    __slots__ = tuple(TaxLinePayload.__annotations__)
+
+
+class LineItem(Projection):
+    __slots__ = tuple(LineItemPayload.__annotations__)
+    nested = {'tax_lines': TaxLine}
+
+
+class ShippingLine(Projection):
+    __slots__ = tuple(ShippingLinePayload.__annotations__)
+
+
+class OrderPayload(Projection):
+    __slots__ = tuple(OrderEventPayload.__annotations__)
+    nested = {
+        'customer': Customer,
+        'billing_address': Address,
+        'shipping_address': Address,
+        'line_items': LineItem,
+        'shipping_lines': ShippingLine,
+        'tax_lines': TaxLine,
+    }
+
+    def __init__(self, source):
+        super().__init__(source)
+        # Shopify only carries the country on the addresses
+        if self.country_code is None:
+            address = self.shipping_address or self.billing_address
+            if address is not None:
+                self.country_code = address.country_code
+
+
+def decode_order_event(body: Union[bytes, str, Mapping]) -> OrderPayload:
+    """Decodes an order event (raw EventGrid JSON or its data) into an OrderPayload projection"""
+
+    doc = body if isinstance(body, Mapping) else _loads(body)
+    if 'data' in doc and 'eventType' in doc:
+        doc = doc['data']
+    return OrderPayload(doc)
@@ -0,0 +1,185 @@
+"""Profiles of slow invocations, switched on from the environment
+
+    NAVISION_PROFILE_THRESHOLD=10    keep the profile of invocations taking 10s or more
+    NAVISION_PROFILE_RATE=0.01       and of 1% of all invocations
+    NAVISION_PROFILE_MODE=sample     sample (collapsed stacks, the default) or cprofile (pstats)
+    NAVISION_PROFILE_INTERVAL=0.01   seconds between stack samples
+    NAVISION_PROFILE_DIR=/tmp/p      where profiles are written
+
+With neither a threshold nor a rate set, invocations are not profiled. A
+kept profile is written as <time>-<label>-<ms>ms.collapsed (or .pstats)
+next to a .json file with the label, the elapsed time and the time spent
+in each Navision method. Collapsed stacks load into flamegraph.pl or
+speedscope. Only one cProfile can run at a time on Python 3.12+, so in
+cprofile mode an invocation that overlaps a profiled one is sampled instead.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+_calls = ContextVar('navision_profile_calls', default=None)
+
+
+def record_call(method, seconds):
+    """Adds a Navision call to the timings of the invocation being profiled, if any"""
+
+    calls = _calls.get()
+    if calls is not None:
+        calls.append((method, seconds))
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('%s@%s:%s' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _Sampler(object):
+    """Samples the stack of one thread from a background thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path + '.collapsed', 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('%s %s\n' % (stack, count))
+
+
+class _Deterministic(object):
+    """cProfile of the invocation"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path + '.pstats')
+
+
+class Profile(object):
+    """What is known about the invocation being profiled; set label once it is known"""
+
+    def __init__(self):
+        self.label = 'unknown'
+        self.calls = []
+        self.elapsed = 0.0
+
+
+class Profiler(object):
+    def __init__(self, threshold=None, rate=0.0, mode='sample', interval=0.01, directory=None):
+        self.threshold = threshold
+        self.rate = rate
+        self.mode = mode
+        self.interval = interval
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'navision-profiles')
+
+    @property
+    def enabled(self):
+        return self.threshold is not None or self.rate > 0
+
+    def _recorder(self):
+        if self.mode == 'cprofile':
+            recorder = _Deterministic()
+            try:
+                recorder.start()
+                return recorder
+            except ValueError:
+                # Python 3.12+ allows one cProfile at a time, which a concurrent invocation holds
+                logger.debug('cProfile is busy, sampling this invocation instead')
+        recorder = _Sampler(threading.get_ident(), self.interval)
+        recorder.start()
+        return recorder
+
+    @contextmanager
+    def profile(self):
+        """Profiles the code in this context, keeping the profile if it is slow or sampled"""
+
+        profile = Profile()
+        if not self.enabled:
+            yield profile
+            return
+
+        start = time.monotonic()
+        recorder = self._recorder()
+        token = _calls.set(profile.calls)
+        try:
+            yield profile
+        finally:
+            recorder.stop()
+            profile.elapsed = time.monotonic() - start
+            _calls.reset(token)
+
+            slow = self.threshold is not None and profile.elapsed >= self.threshold
+            if slow or random.random() < self.rate:
+                try:
+                    self._write(profile, recorder, 'slow' if slow else 'sampled')
+                except OSError:
+                    logger.exception('Could not write the profile of %s', profile.label)
+
+    def _write(self, profile, recorder, reason):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, '%s-%s-%dms' % (
+            time.strftime('%Y%m%dT%H%M%S'), re.sub(r'[^\w.-]', '_', str(profile.label)), profile.elapsed * 1000))
+
+        recorder.write(path)
+        timings = {}
+        for method, seconds in profile.calls:
+            timing = timings.setdefault(method, {'calls': 0, 'seconds': 0.0})
+            timing['calls'] += 1
+            timing['seconds'] += seconds
+        with open(path + '.json', 'w') as f:
+            json.dump({
+                'label': profile.label,
+                'reason': reason,
+                'elapsed': profile.elapsed,
+                'methods': timings,
+                'calls': profile.calls,
+            }, f, indent=2)
+        logger.warning('Wrote %s profile of %s (%.1fs) to %s', reason, profile.label, profile.elapsed, path)
+
+
+profiler = Profiler(
+    threshold=float(os.environ["NAVISION_PROFILE_THRESHOLD"]) if os.environ.get("NAVISION_PROFILE_THRESHOLD") else None,
+    rate=float(os.environ.get("NAVISION_PROFILE_RATE", "0")),
+    mode=os.environ.get("NAVISION_PROFILE_MODE", "sample"),
+    interval=float(os.environ.get("NAVISION_PROFILE_INTERVAL", "0.01")),
+    directory=os.environ.get("NAVISION_PROFILE_DIR"),
+)
@@ -0,0 +1,203 @@
+"""Checks which orders are fully settled in Navision
+
+    python -m samples-orders-navision-create.reconcile payments.jsonl --workers 8 \\
+        --checkpoint reconcile.done --report mismatches.csv
+
+Each input line is a JSON object for one (order, balance transaction) pair:
+
+    {"order_number": "1010", "navision_customer": "WUS", "reference": "ch_3N6yQ2Kx0l7Q1", "amount": "141.43"}
+
+country_code may be given instead of navision_customer, and amount may be
+left out to only check that nothing is unapplied. Lines that cannot be read
+are logged, reported and counted as failed, and the job carries on. For every pair,
+get_unapplied_amount and get_applied_amount run concurrently on a bounded
+pool of workers at bulk priority. A pair is settled when nothing is
+unapplied and the applied amount equals amount. Mismatches and failures
+are written to the report as they are found; settled and mismatched pairs
+go into the checkpoint file, so a rerun only retries failures and pairs it
+has not reached yet.
+"""
+import argparse
+import csv
+import fileinput
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from .country_vat import vat_dicts
+from .jobs import Checkpoint, Progress, percentiles
+from .navision import navision
+from .scheduler import BULK
+
+logger = logging.getLogger(__name__)
+
+SETTLED = 'settled'
+MISMATCH = 'mismatch'
+FAILED = 'failed'
+
+ReconcileOrder = namedtuple('ReconcileOrder', 'order_number navision_customer')
+Payment = namedtuple('Payment', 'reference amount')
+Pair = namedtuple('Pair', 'order balance_transaction')
+
+
+def pair_key(pair):
+    return '%s:%s' % (pair.order.order_number, pair.balance_transaction.reference)
+
+
+def read_pairs(paths, invalid=None):
+    """Yields a Pair per input line, passing '<file>:<line>' and the error for unreadable lines to invalid"""
+
+    with fileinput.input(paths) as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                values = json.loads(line)
+                customer = values.get('navision_customer')
+                if not customer:
+                    customer = vat_dicts[values['country_code'].upper()].navision_customer
+                amount = values.get('amount')
+                pair = Pair(
+                    ReconcileOrder(str(values['order_number']), customer),
+                    Payment(values['reference'], None if amount is None else Decimal(str(amount))),
+                )
+            except (ValueError, KeyError, TypeError, AttributeError, ArithmeticError) as e:
+                if invalid is None:
+                    raise
+                invalid('%s:%s' % (lines.filename(), lines.filelineno()), e)
+                continue
+            yield pair
+
+
+class ReconcileJob(object):
+    def __init__(self, workers=4, checkpoint=None, report=None, client=navision):
+        self.workers = workers
+        self.checkpoint = Checkpoint(checkpoint)
+        self.client = client
+
+        self.report = None
+        self._report_file = None
+        if report:
+            self._report_file = open(report, 'w', newline='')
+            self.report = csv.writer(self._report_file)
+            self.report.writerow(('order_number', 'reference', 'amount', 'applied', 'unapplied', 'outcome', 'error'))
+
+        self.latencies = {}
+        self.outcomes = {}
+        self.progress = Progress('reconcile')
+        self._lock = threading.Lock()
+
+    def _call(self, method, fn, *args):
+        start = time.monotonic()
+        try:
+            with self.client.priority(BULK):
+                return fn(*args)
+        finally:
+            seconds = time.monotonic() - start
+            with self._lock:
+                self.latencies.setdefault(method, []).append(seconds)
+
+    def _finish(self, pair, unapplied, applied):
+        order, payment = pair
+        error = ''
+        try:
+            unapplied_amount = unapplied.result()
+            applied_amount = applied.result()
+        except Exception as e:
+            logger.error('Could not reconcile order %s - %r', order.order_number, e)
+            outcome = FAILED
+            unapplied_amount = applied_amount = ''
+            error = repr(e)
+        else:
+            settled = unapplied_amount == 0 and (payment.amount is None or applied_amount == payment.amount)
+            outcome = SETTLED if settled else MISMATCH
+
+        if outcome != FAILED:
+            self.checkpoint.add(pair_key(pair))
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if outcome != SETTLED and self.report is not None:
+                self.report.writerow((order.order_number, payment.reference, payment.amount,
+                                      applied_amount, unapplied_amount, outcome, error))
+                self._report_file.flush()
+        self.progress.update(ok=outcome != FAILED)
+
+    def invalid(self, location, error):
+        """Counts an input line that could not be read as failed"""
+
+        logger.error('Invalid payment line at %s - %r', location, error)
+        with self._lock:
+            self.outcomes[FAILED] = self.outcomes.get(FAILED, 0) + 1
+            if self.report is not None:
+                self.report.writerow(('', '', '', '', '', FAILED, '%s: %r' % (location, error)))
+                self._report_file.flush()
+        self.progress.update(ok=False)
+
+    def run(self, pairs):
+        # Bound the pairs in flight so a long stream is not read into memory up front
+        slots = threading.BoundedSemaphore(self.workers)
+
+        try:
+            with ThreadPoolExecutor(self.workers) as pool:
+                for pair in pairs:
+                    if pair_key(pair) in self.checkpoint:
+                        continue
+                    slots.acquire()
+
+                    unapplied = pool.submit(self._call, 'GetUnappliedAmount', self.client.get_unapplied_amount,
+                                            pair.order)
+                    applied = pool.submit(self._call, 'GetAppliedAmount', self.client.get_applied_amount,
+                                          pair.order, pair.balance_transaction)
+                    pending = [2]
+
+                    def done(future, pair=pair, unapplied=unapplied, applied=applied, pending=pending):
+                        with self._lock:
+                            pending[0] -= 1
+                            last = pending[0] == 0
+                        if last:
+                            try:
+                                self._finish(pair, unapplied, applied)
+                            finally:
+                                slots.release()
+
+                    unapplied.add_done_callback(done)
+                    applied.add_done_callback(done)
+        finally:
+            # Keep what was reconciled so far, even if reading the input blew up
+            self.checkpoint.close()
+            if self._report_file is not None:
+                self._report_file.close()
+        self.progress.finish()
+        return self.outcomes.get(FAILED, 0) == 0
+
+    def summary(self):
+        lines = ['reconcile: %s' % (
+            ', '.join('%s=%s' % item for item in sorted(self.outcomes.items())) or 'nothing to do')]
+        for method, latencies in sorted(self.latencies.items()):
+            timings = percentiles(latencies, (50, 90, 99, 100))
+            lines.append('  %s: %s calls, p50=%.3fs p90=%.3fs p99=%.3fs max=%.3fs' % (
+                method, len(latencies), timings[50], timings[90], timings[99], timings[100]))
+        return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check which orders are fully settled in Navision')
+    parser.add_argument('paths', nargs='+', help='JSONL files with one order and payment per line, or - for stdin')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent Navision calls')
+    parser.add_argument('--checkpoint', help='file of reconciled pairs to skip and append to')
+    parser.add_argument('--report', help='CSV file for mismatches and failures')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    job = ReconcileJob(workers=args.workers, checkpoint=args.checkpoint, report=args.report)
+    ok = job.run(read_pairs(args.paths, invalid=job.invalid))
+    print(job.summary())
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
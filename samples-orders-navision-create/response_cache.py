@@ -0,0 +1,61 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def digest(content):
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+class ResponseCache(object):
+    """Decoded results of bulk reads, keyed by request and reused while NAV returns the same bytes
+
+    Each entry remembers the hash of the raw response it was decoded from and
+    how long decoding took. A response with the same hash is answered from the
+    entry without parsing, and the time that parsing took is counted as saved.
+    At most max_entries requests are kept, least recently used first out;
+    with max_entries=0 nothing is kept and every response is parsed.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key, content_digest):
+        """The cached result for key if it was decoded from a response with content_digest, else None"""
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != content_digest:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.saved += entry[2]
+            return entry[1]
+
+    def put(self, key, content_digest, result, parse_time):
+        with self._lock:
+            self.entries[key] = (content_digest, result, parse_time)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'parse_seconds_saved': self.saved,
+            }
@@ -0,0 +1,140 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+class Endpoint(object):
+    __slots__ = ('url', 'latency', 'error_rate', 'requests', 'errors', 'consecutive_errors', 'ejected_until', 'ejections',
+                 'chosen_at', 'chosen_seq', 'probes')
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.chosen_at = 0.0
+        self.chosen_seq = 0
+        self.probes = 0
+
+    def score(self):
+        # Endpoints without samples go first so every tier gets measured
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + 10 * self.error_rate)
+
+
+class EndpointRouter(object):
+    """Picks a NAV service tier by recent latency and error score
+
+    Each call goes to the better scoring of two healthy endpoints picked at
+    random, so load spreads over the tiers instead of piling onto the single
+    best one. At most one call in probe_every goes out as a probe, to the
+    healthy endpoint that has gone longest unchosen, provided that was at
+    least probe_every calls or probe_after seconds ago. One slow sample then
+    cannot starve an endpoint of the traffic that would correct its score,
+    while scores still decide nearly all of the traffic, however low it is.
+
+    Keys (order numbers) stick to the endpoint they were first routed to
+    while it stays healthy. Endpoints with max_errors consecutive errors are
+    ejected for eject_for seconds and then get traffic again as a probe; one
+    more error ejects them again.
+    """
+
+    def __init__(self, urls, alpha=0.2, max_errors=3, eject_for=30, sticky_size=10000,
+                 probe_every=20, probe_after=5.0):
+        if not urls:
+            raise ValueError('At least one Navision url is required')
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.alpha = alpha
+        self.max_errors = max_errors
+        self.eject_for = eject_for
+        self.sticky_size = sticky_size
+        self.probe_every = probe_every
+        self.probe_after = probe_after
+        self._choices = 0
+        self._probed_at = 0
+
+        self._sticky = OrderedDict()
+        self._lock = threading.Lock()
+
+    def choose(self, key=None, exclude=()):
+        with self._lock:
+            now = time.monotonic()
+            self._choices += 1
+            healthy = [e for e in self.endpoints if e.ejected_until <= now and e not in exclude]
+
+            if key is not None:
+                # Order numbers arrive as ints from events and as strs from NavOrder
+                key = str(key)
+                endpoint = self._sticky.get(key)
+                if endpoint is not None and endpoint in healthy:
+                    self._sticky.move_to_end(key)
+                    endpoint.chosen_at, endpoint.chosen_seq = now, self._choices
+                    return endpoint
+
+            stale = None
+            if len(healthy) > 1 and self._choices - self._probed_at >= self.probe_every:
+                stale = min(healthy, key=lambda e: e.chosen_at)
+                if self._choices - stale.chosen_seq < self.probe_every and now - stale.chosen_at < self.probe_after:
+                    stale = None
+
+            if stale is not None:
+                endpoint = stale
+                endpoint.probes += 1
+                self._probed_at = self._choices
+            elif len(healthy) > 2:
+                endpoint = min(random.sample(healthy, 2), key=Endpoint.score)
+            elif healthy:
+                endpoint = min(healthy, key=Endpoint.score)
+            else:
+                candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+                endpoint = min(candidates, key=lambda e: e.ejected_until)
+            endpoint.chosen_at, endpoint.chosen_seq = now, self._choices
+
+            if key is not None:
+                self._sticky[key] = endpoint
+                self._sticky.move_to_end(key)
+                if len(self._sticky) > self.sticky_size:
+                    self._sticky.popitem(last=False)
+            return endpoint
+
+    def record(self, endpoint, latency, ok):
+        with self._lock:
+            endpoint.requests += 1
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += self.alpha * (latency - endpoint.latency)
+            endpoint.error_rate += self.alpha * ((0.0 if ok else 1.0) - endpoint.error_rate)
+
+            if ok:
+                endpoint.consecutive_errors = 0
+                return
+
+            endpoint.errors += 1
+            endpoint.consecutive_errors += 1
+            if endpoint.consecutive_errors >= self.max_errors:
+                endpoint.ejected_until = time.monotonic() + self.eject_for
+                endpoint.ejections += 1
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    'url': e.url,
+                    'latency': e.latency,
+                    'error_rate': e.error_rate,
+                    'requests': e.requests,
+                    'errors': e.errors,
+                    'ejections': e.ejections,
+                    'probes': e.probes,
+                    'ejected': e.ejected_until > now,
+                }
+                for e in self.endpoints
+            ]
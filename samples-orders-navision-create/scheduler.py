@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+INTERACTIVE = 0
+BACKGROUND = 1
+BULK = 2
+
+CLASSES = (INTERACTIVE, BACKGROUND, BULK)
+CLASS_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background', BULK: 'bulk'}
+
+
+def default_reservations(limit):
+    """Reserved slots per class for limit concurrent calls
+
+    Small limits reserve less, so at least one slot stays shared and every
+    class can run.
+    """
+
+    return {
+        INTERACTIVE: limit // 2,
+        BACKGROUND: 1 if limit > 2 else 0,
+        BULK: 1 if limit > 3 else 0,
+    }
+
+
+class SlotTimeout(TimeoutError):
+    """No slot was granted in time; distinct from the timeouts of the call made in the slot"""
+
+
+class PriorityScheduler(object):
+    """Caps concurrent NAV calls, giving each priority class reserved slots
+
+    A class first uses its own reserved slots and then the shared ones. A
+    freed shared slot always goes to the most urgent class that is waiting,
+    so queued bulk work never delays an interactive call for longer than one
+    in-flight call takes. Calls already running are not interrupted.
+    """
+
+    def __init__(self, limit, reserved):
+        if limit < 1:
+            raise ValueError('The limit must be at least 1, not %s' % limit)
+        self.limit = limit
+        self.reserved = dict.fromkeys(CLASSES, 0)
+        self.reserved.update(reserved)
+        self.shared = limit - sum(self.reserved.values())
+        if self.shared < 0:
+            raise ValueError('Reserved slots (%s) exceed the limit (%s)' % (sum(self.reserved.values()), limit))
+        # A class with no reserved slot lives on the shared ones, and would wait forever without any
+        unreachable = [CLASS_NAMES[cls] for cls in CLASSES if not self.reserved[cls] and not self.shared]
+        if unreachable:
+            raise ValueError('No slot can ever go to %s calls with limit %s and reservations %s' % (
+                ', '.join(unreachable), limit, reserved))
+
+        self.in_use = dict.fromkeys(CLASSES, 0)
+        self.waiting = {cls: deque() for cls in CLASSES}
+        self.calls = dict.fromkeys(CLASSES, 0)
+        self.wait_total = dict.fromkeys(CLASSES, 0.0)
+        self.wait_max = dict.fromkeys(CLASSES, 0.0)
+        self._cond = threading.Condition()
+
+    def _grantable(self, cls):
+        if self.in_use[cls] < self.reserved[cls]:
+            return True
+        shared_in_use = sum(max(0, self.in_use[c] - self.reserved[c]) for c in CLASSES)
+        if shared_in_use >= self.shared:
+            return False
+        return not any(self.waiting[c] for c in CLASSES if c < cls)
+
+    @contextmanager
+    def slot(self, cls, timeout=None):
+        """Holds a slot for class cls, raising SlotTimeout if none is granted within timeout seconds"""
+
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            queue = self.waiting[cls]
+            queue.append(ticket)
+            try:
+                while queue[0] is not ticket or not self._grantable(cls):
+                    if timeout is None:
+                        self._cond.wait()
+                        continue
+                    remaining = start + timeout - time.monotonic()
+                    if remaining <= 0:
+                        raise SlotTimeout('No %s slot within %.1fs' % (CLASS_NAMES[cls], timeout))
+                    self._cond.wait(remaining)
+            finally:
+                queue.remove(ticket)
+                # Whoever is now first in line may be grantable
+                self._cond.notify_all()
+            self.in_use[cls] += 1
+
+            waited = time.monotonic() - start
+            self.calls[cls] += 1
+            self.wait_total[cls] += waited
+            self.wait_max[cls] = max(self.wait_max[cls], waited)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use[cls] -= 1
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                CLASS_NAMES[cls]: {
+                    'reserved': self.reserved[cls],
+                    'in_use': self.in_use[cls],
+                    'waiting': len(self.waiting[cls]),
+                    'calls': self.calls[cls],
+                    'wait_avg': self.wait_total[cls] / self.calls[cls] if self.calls[cls] else 0.0,
+                    'wait_max': self.wait_max[cls],
+                }
+                for cls in CLASSES
+            }
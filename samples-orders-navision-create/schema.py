@@ -1,6 +1,60 @@
-from typing import TypedDict
+from typing import List, Optional, TypedDict
+
+
+# The payload types below describe the projection of the Shopify order event
+# that the function actually uses. payload.decode_order_event keeps exactly
+# these fields and drops the rest of the document.
+
+class AddressPayload(TypedDict):
+    name: str
+    company: Optional[str]
+    address1: str
+    address2: Optional[str]
+    city: Optional[str]
+    zip: Optional[str]
+    province_code: Optional[str]
+    country_code: str
+
+
+class CustomerPayload(TypedDict):
+    id: int
+    email: Optional[str]
+
+
+class TaxLinePayload(TypedDict):
+    title: str
+    price: str
+    rate: float
+
+
+class LineItemPayload(TypedDict):
+    sku: str
+    name: str
+    quantity: int
+    price: str
+    total_discount: str
+    tax_lines: List[TaxLinePayload]
+
+
+class ShippingLinePayload(TypedDict):
+    title: str
+    price: str
+    discounted_price: str
 
 
 class OrderEventPayload(TypedDict):
     id: int
     order_number: int
+    created_at: str
+    updated_at: Optional[str]
+    currency: str
+    country_code: str
+    email: Optional[str]
+    phone: Optional[str]
+    reference: Optional[str]
+    customer: CustomerPayload
+    billing_address: Optional[AddressPayload]
+    shipping_address: Optional[AddressPayload]
+    line_items: List[LineItemPayload]
+    shipping_lines: List[ShippingLinePayload]
+    tax_lines: List[TaxLinePayload]
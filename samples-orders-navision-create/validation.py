@@ -0,0 +1,202 @@
+import logging
+import os
+import threading
+import time
+
+from lxml import etree
+
+from .navision import NavisionError, OrderValidationError, navision
+
+logger = logging.getLogger(__name__)
+
+# Shape of the CreateOrder order XMLport. Field lengths follow the NAV
+# table fields; the address and item name limits match what
+# Navision._build_address and _build_order_lines truncate to.
+ORDER_XSD = b"""<?xml version="1.0" encoding="utf-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+           xmlns:gw="urn:microsoft-dynamics-schemas/codeunit/Gateway"
+           targetNamespace="urn:microsoft-dynamics-schemas/codeunit/Gateway"
+           elementFormDefault="unqualified">
+
+  <xs:simpleType name="code10"><xs:restriction base="xs:string"><xs:maxLength value="10"/></xs:restriction></xs:simpleType>
+  <xs:simpleType name="code20"><xs:restriction base="xs:string"><xs:maxLength value="20"/></xs:restriction></xs:simpleType>
+  <xs:simpleType name="requiredCode20"><xs:restriction base="xs:string"><xs:minLength value="1"/><xs:maxLength value="20"/></xs:restriction></xs:simpleType>
+  <xs:simpleType name="text30"><xs:restriction base="xs:string"><xs:maxLength value="30"/></xs:restriction></xs:simpleType>
+  <xs:simpleType name="requiredText30"><xs:restriction base="xs:string"><xs:minLength value="1"/><xs:maxLength value="30"/></xs:restriction></xs:simpleType>
+  <xs:simpleType name="text35"><xs:restriction base="xs:string"><xs:maxLength value="35"/></xs:restriction></xs:simpleType>
+  <xs:simpleType name="text80"><xs:restriction base="xs:string"><xs:maxLength value="80"/></xs:restriction></xs:simpleType>
+  <xs:simpleType name="date"><xs:restriction base="xs:string"><xs:pattern value="\\d{2}-\\d{2}-\\d{4}"/></xs:restriction></xs:simpleType>
+  <xs:simpleType name="currency"><xs:restriction base="xs:string"><xs:pattern value="[A-Z]{3}"/></xs:restriction></xs:simpleType>
+  <xs:simpleType name="country"><xs:restriction base="xs:string"><xs:pattern value="[A-Z]{2}"/></xs:restriction></xs:simpleType>
+  <xs:simpleType name="lineType">
+    <xs:restriction base="xs:string"><xs:enumeration value="Item"/><xs:enumeration value="G/L"/></xs:restriction>
+  </xs:simpleType>
+
+  <xs:complexType name="address">
+    <xs:sequence>
+      <xs:element name="name" type="gw:requiredText30"/>
+      <xs:element name="address1" type="gw:requiredText30"/>
+      <xs:element name="address2" type="gw:text30"/>
+      <xs:element name="postalNo">
+        <xs:simpleType><xs:restriction base="xs:string"><xs:maxLength value="25"/></xs:restriction></xs:simpleType>
+      </xs:element>
+      <xs:element name="city" type="gw:text30"/>
+      <xs:element name="county" type="gw:text30"/>
+      <xs:element name="country" type="gw:country"/>
+      <xs:element name="contactName" type="gw:text30"/>
+    </xs:sequence>
+  </xs:complexType>
+
+  <xs:element name="order">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="header">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:element name="orderNo" type="gw:requiredCode20"/>
+              <xs:element name="externalDocNo" type="gw:text35"/>
+              <xs:element name="sellToCustomerNo" type="gw:requiredCode20"/>
+              <xs:element name="department" type="gw:code20"/>
+              <xs:element name="genBusPostingGroup" type="gw:code10"/>
+              <xs:element name="vatBusPostingGroup" type="gw:code10"/>
+              <xs:element name="internalComment" type="gw:text80"/>
+              <xs:element name="orderDate" type="gw:date"/>
+              <xs:element name="currency" type="gw:currency"/>
+              <xs:element name="paymentTermsCode" type="gw:code10"/>
+              <xs:element name="locationCode" type="gw:code10"/>
+              <xs:element name="phoneNo" type="gw:text30"/>
+              <xs:element name="email" type="gw:text80"/>
+              <xs:element name="yourReference" type="gw:text35"/>
+            </xs:sequence>
+          </xs:complexType>
+        </xs:element>
+        <xs:element name="billToAddress" type="gw:address"/>
+        <xs:element name="shipToAddress" type="gw:address"/>
+        <xs:element name="orderLineList">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:element name="orderLine" minOccurs="1" maxOccurs="unbounded">
+                <xs:complexType>
+                  <xs:sequence>
+                    <xs:element name="lineType" type="gw:lineType"/>
+                    <xs:element name="itemNo" type="gw:requiredCode20"/>
+                    <xs:element name="itemName" type="gw:text30"/>
+                    <xs:element name="quantity" type="xs:decimal"/>
+                    <xs:element name="price" type="xs:decimal"/>
+                    <xs:element name="total" type="xs:decimal"/>
+                    <xs:element name="salesTaxCode" type="gw:code20"/>
+                  </xs:sequence>
+                </xs:complexType>
+              </xs:element>
+            </xs:sequence>
+          </xs:complexType>
+        </xs:element>
+      </xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+ORDER_SCHEMA = etree.XMLSchema(etree.fromstring(ORDER_XSD))
+
+# Longest NavAddress values that Navision._build_address sends whole. Anything
+# longer is cut before the schema ever sees it, so it is checked on the mapped
+# order instead. Item names are truncated too, but they are only descriptive:
+# NAV takes the item from itemNo.
+ADDRESS_LIMITS = (('company', 30), ('name', 30), ('line1', 30), ('line2', 30), ('postcode', 25), ('city', 30))
+
+
+class OrderValidator(object):
+    """Checks CreateOrder orders against field limits, the XMLport schema and cached NAV master data
+
+    Item numbers are loaded in the background, one load at a time, so an order
+    never waits for GetItems: until the first load finishes SKUs are not
+    checked, and once items_ttl has passed the stale set is used while the
+    next load runs.
+    """
+
+    # Seconds before a failed load of the items is tried again
+    retry_after = 60
+
+    def __init__(self, client, currencies=None, items_ttl=3600):
+        self.client = client
+        self.currencies = set(currencies) if currencies else None
+        self.items_ttl = items_ttl
+
+        self._skus = None
+        self._next_load = 0.0
+        self._loading = False
+        self._lock = threading.Lock()
+        self._loading_lock = threading.Lock()
+
+    def known_skus(self):
+        """Item numbers known to NAV, or None until they are first loaded; starts a reload when stale"""
+
+        if time.monotonic() >= self._next_load:
+            with self._loading_lock:
+                if self._loading:
+                    return self._skus
+                self._loading = True
+            threading.Thread(target=self._load_skus, name='validation-items', daemon=True).start()
+        return self._skus
+
+    def _load_skus(self):
+        try:
+            self._skus = frozenset(item.sku for item in self.client.get_items())
+            self._next_load = time.monotonic() + self.items_ttl
+        except (NavisionError, OSError):
+            # Orders keep using the stale set until a later load succeeds
+            logger.warning('Could not load Navision items for order validation', exc_info=True)
+            self._next_load = time.monotonic() + min(self.items_ttl, self.retry_after)
+        finally:
+            with self._loading_lock:
+                self._loading = False
+
+    def validate_order(self, order):
+        """Checks a mapped NavOrder for address values that rendering would truncate"""
+
+        problems = []
+        for kind, address in (('billing', order.billing_address), ('shipping', order.shipping_address)):
+            if address is None:
+                continue
+            for field, limit in ADDRESS_LIMITS:
+                value = getattr(address, field)
+                if field == 'city' and value and address.subdivision_id:
+                    # Rendered as "city, XX"
+                    limit -= len(address.subdivision_short_id) + 2
+                if value and len(value) > limit:
+                    problems.append('%s address %s is longer than %s characters' % (kind, field, limit))
+
+        if problems:
+            raise OrderValidationError(order.order_number, problems)
+
+    def validate(self, order):
+        """Checks a rendered order element against the schema and master data"""
+
+        problems = []
+
+        with self._lock:
+            if not ORDER_SCHEMA.validate(order):
+                problems.extend(error.message for error in ORDER_SCHEMA.error_log)
+
+        header = order.find('header')
+        currency = header.findtext('currency')
+        if self.currencies is not None and currency not in self.currencies:
+            problems.append('unknown currency %s' % currency)
+
+        skus = self.known_skus()
+        if skus is not None:
+            for line in order.iter('orderLine'):
+                sku = line.findtext('itemNo')
+                if line.findtext('lineType') == 'Item' and sku not in skus:
+                    problems.append('unknown item %s' % sku)
+
+        if problems:
+            raise OrderValidationError(header.findtext('externalDocNo'), problems)
+
+
+validator = OrderValidator(
+    navision,
+    currencies=[c for c in os.environ.get('NAVISION_CURRENCIES', '').split(',') if c],
+    items_ttl=int(os.environ.get('NAVISION_ITEMS_TTL', '3600')),
+)
@@ -0,0 +1,38 @@
+import importlib
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = 'samples-orders-navision-create'
+
+# What the package reads from the environment and the working directory when it is imported
+SETTINGS = {
+    'NAVISION_URL': 'http://navision.invalid/nav',
+    'NAVISION_USERNAME': 'user',
+    'NAVISION_PASSWORD': 'password',
+    'NAVISION_ORDER_NUMBER_PREFIX': 'W',
+    'NAVISION_SHIPPING_ACCOUNT': '6100',
+}
+VAT_CODES = {'US': 'UDL./WEB', 'DK': 'IND./WEB'}
+
+
+def load(module):
+    """Imports a module of the function package, e.g. load('order')"""
+
+    for name, value in SETTINGS.items():
+        os.environ.setdefault(name, value)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    # navision.py loads vat_codes.json from the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'vat_codes.json'), 'w') as f:
+            json.dump(VAT_CODES, f)
+        os.chdir(directory)
+        try:
+            return importlib.import_module('%s.%s' % (PACKAGE, module))
+        finally:
+            os.chdir(cwd)
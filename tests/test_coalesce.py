@@ -0,0 +1,57 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from support import load
+
+coalesce = load('coalesce')
+
+
+class CoalescerTest(unittest.TestCase):
+    def burst(self, coalescer, versions):
+        """Sends events for one order 20ms apart and returns which were let through"""
+
+        results = [None] * len(versions)
+
+        def send(i, version):
+            time.sleep(i * 0.02)
+            results[i] = coalescer.newest('1010', version)
+
+        threads = [threading.Thread(target=send, args=(i, version)) for i, version in enumerate(versions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def coalescers(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        yield 'memory', coalesce.Coalescer(0.2)
+        yield 'sqlite', coalesce.Coalescer(0.2, os.path.join(directory.name, 'coalesce.sqlite3'))
+
+    def test_ordering(self):
+        cases = [
+            ((100.0, 200.0), [False, True]),
+            ((200.0, 100.0), [True, False]),
+            ((100.0, 100.0), [False, True]),
+            # Without a version on both sides an event is only as new as its arrival
+            ((100.0, None), [False, True]),
+            ((None, 100.0), [False, True]),
+            ((None, None), [False, True]),
+            ((200.0, None, 100.0), [False, False, True]),
+        ]
+        for name, coalescer in self.coalescers():
+            for versions, expected in cases:
+                with self.subTest(store=name, versions=versions):
+                    self.assertEqual(self.burst(coalescer, versions), expected)
+
+    def test_no_window_lets_everything_through(self):
+        coalescer = coalesce.Coalescer(0)
+        self.assertEqual(self.burst(coalescer, (200.0, 100.0)), [True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+
+from support import load
+
+hedging = load('hedging')
+
+
+class HedgerTest(unittest.TestCase):
+    def hedger(self):
+        hedger = hedging.Hedger(percentile=50, budget=1, burst=10, min_samples=10, workers=8)
+        for _ in range(10):
+            hedger.run('OrderExists', lambda target: target, lambda exclude: 'a')
+        self.assertIsNotNone(hedger.delay('OrderExists'))
+        hedger.delays['OrderExists'] = 0.02
+        return hedger
+
+    def test_no_hedging_while_a_loser_is_running(self):
+        hedger = self.hedger()
+        release = threading.Event()
+        sent = []
+
+        def send(target):
+            sent.append(target)
+            if target == 'slow':
+                release.wait(5)
+            return target
+
+        def choose(exclude):
+            return 'fast' if exclude else 'slow'
+
+        self.assertEqual(hedger.run('OrderExists', send, choose), 'fast')
+        self.assertEqual(hedger.stats()['abandoned_running'], 1)
+
+        # The abandoned attempt still holds a connection, so the next slow call is not hedged
+        second = threading.Thread(target=hedger.run, args=('OrderExists', send, choose))
+        second.start()
+        time.sleep(0.2)
+        self.assertEqual(sent, ['slow', 'fast', 'slow'])
+        release.set()
+        second.join(5)
+
+        deadline = time.monotonic() + 5
+        while hedger.stats()['abandoned_running'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stats = hedger.stats()
+        self.assertEqual((stats['hedged'], stats['hedge_wins'], stats['abandoned'], stats['abandoned_running']),
+                         (1, 1, 1, 0))
+
+        # With the loser done, slow calls are hedged again
+        release.clear()
+        self.assertEqual(hedger.run('OrderExists', send, choose), 'fast')
+        self.assertEqual(hedger.stats()['hedged'], 2)
+        release.set()
+
+    def test_failed_attempt_is_not_abandoned(self):
+        hedger = self.hedger()
+
+        def send(target):
+            if target == 'slow':
+                time.sleep(0.1)
+                raise ConnectionError(target)
+            time.sleep(0.2)
+            return target
+
+        self.assertEqual(hedger.run('OrderExists', send, lambda exclude: 'fast' if exclude else 'slow'), 'fast')
+        self.assertEqual(hedger.stats()['abandoned'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
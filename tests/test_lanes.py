@@ -0,0 +1,61 @@
+import threading
+import time
+import unittest
+
+from support import load
+
+lanes = load('lanes')
+
+
+class LaneExecutorTest(unittest.TestCase):
+    def test_work_for_one_key_stays_in_order(self):
+        done = {}
+        lock = threading.Lock()
+
+        def record(key, i):
+            time.sleep(0.001 * (i % 3))
+            with lock:
+                done.setdefault(key, []).append(i)
+
+        with lanes.LaneExecutor(4, queue_size=2) as executor:
+            for i in range(60):
+                executor.submit(i % 5, record, i % 5, i)
+
+        self.assertEqual(done, {key: list(range(key, 60, 5)) for key in range(5)})
+
+    def test_keys_with_nothing_in_flight_go_around_a_slow_lane(self):
+        release = threading.Event()
+        finished = []
+
+        with lanes.LaneExecutor(2, queue_size=2) as executor:
+            slow = executor.submit('slow', release.wait, 5)
+            home = lanes.lane_for('slow', 2)
+            # Every key would hash onto the slow lane; none of them should wait for it
+            keys = [key for key in map(str, range(1000)) if lanes.lane_for(key, 2) == home][:10]
+            start = time.monotonic()
+            for key in keys:
+                executor.submit(key, finished.append, key)
+            submitted = time.monotonic() - start
+            # Only what was queued while every lane was busy can be stuck behind the slow order
+            deadline = time.monotonic() + 2
+            while len(finished) < len(keys) - 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            unblocked = len(finished)
+            release.set()
+            slow.result(5)
+
+        self.assertLess(submitted, 1)
+        self.assertGreaterEqual(unblocked, len(keys) - 2)
+        self.assertEqual(sorted(finished), sorted(keys))
+
+    def test_failure_is_set_on_the_future(self):
+        with lanes.LaneExecutor(2) as executor:
+            future = executor.submit('1010', int, 'x')
+            after = executor.submit('1010', int, '1')
+        with self.assertRaises(ValueError):
+            future.result()
+        self.assertEqual(after.result(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import copy
+import unittest
+from decimal import Decimal
+
+from support import load
+
+order = load('order')
+mapping = load('mapping')
+payload = load('payload')
+navision = load('navision')
+common = load('benchmarks.common')
+country_vat = load('country_vat')
+
+
+def reference_order(data):
+    """generate_order_data written out by hand against the raw event data, to check the compiled mapping"""
+
+    def address(a):
+        if a is None:
+            return None
+        return order.NavAddress(
+            company=a.get('company'),
+            name=a.get('name') or '',
+            line1=a.get('address1') or '',
+            line2=a.get('address2'),
+            postcode=a.get('zip'),
+            city=a.get('city'),
+            subdivision_id=a.get('province_code'),
+            subdivision_short_id=(a.get('province_code') or '').upper(),
+            country_id=(a.get('country_code') or '').upper(),
+        )
+
+    country_code = data.get('country_code')
+    if country_code is None:
+        shipping = data.get('shipping_address') or data.get('billing_address')
+        country_code = shipping and shipping.get('country_code')
+    country = country_vat.vat_dicts.get(country_code.upper()) if country_code else None
+
+    shipping_lines = data.get('shipping_lines') or []
+    tax = sum((Decimal(line['price']) for line in data.get('tax_lines') or []), Decimal(0))
+    tax_address = data.get('shipping_address') or data.get('billing_address')
+
+    return order.NavOrder(
+        order_number=str(data['order_number']),
+        created_at=data['created_at'],
+        navision_customer=country.navision_customer if country else None,
+        navision_department=country.navision_department if country else None,
+        charge_currency_id=data['currency'].upper(),
+        payment_terms_code=order.ORDER['payment_terms_code'],
+        location_code=order.ORDER['location_code'],
+        phone_number=data.get('phone') or '',
+        email=data.get('email') or (data.get('customer') or {}).get('email') or '',
+        your_reference=str(data.get('reference') or data['order_number']),
+        country=country,
+        billing_address=address(data.get('billing_address')),
+        shipping_address=address(data.get('shipping_address')),
+        alacart_items=tuple(
+            order.NavOrderLine(
+                sku=line['sku'],
+                name=line.get('name') or '',
+                quantity=line['quantity'],
+                msrp_charge=Decimal(line['price']),
+                total_with_discount_charge=Decimal(line['price']) * line['quantity']
+                - Decimal(line.get('total_discount') or 0),
+            )
+            for line in data.get('line_items') or []
+        ),
+        shipping_method=order.ShippingMethod(
+            name=shipping_lines[0]['title'][:30] if shipping_lines and shipping_lines[0].get('title') else 'Shipping',
+            msrp_charge=sum((Decimal(line['price']) for line in shipping_lines), Decimal(0)),
+            price_charge=sum((Decimal(line.get('discounted_price') or line['price']) for line in shipping_lines),
+                             Decimal(0)),
+        ),
+        report_sales_tax=(country_code or '').upper() == 'US',
+        sales_tax={(tax_address.get('province_code') or '').upper() if tax_address else '': tax} if tax else {},
+    )
+
+
+def sample_data():
+    return common.load_sample_event()['data']
+
+
+def busy_data():
+    """sample.dat with several priced and discounted lines, shipping, tax and fallbacks to exercise"""
+
+    data = copy.deepcopy(sample_data())
+    line = data['line_items'][0]
+    data['line_items'] = [
+        dict(line, sku='61611', quantity=2, price='99.99', total_discount='10.00'),
+        dict(line, sku='64347', name='apex pro mini', quantity=1, price='179.99', total_discount=None),
+    ]
+    data['shipping_lines'] = [
+        {'title': 'UPS Next Day Air Saver and a very long name', 'price': '25.00', 'discounted_price': '20.00'},
+        {'title': 'Handling', 'price': '2.50', 'discounted_price': None},
+    ]
+    data['tax_lines'] = [{'title': 'IL State Tax', 'price': '14.12', 'rate': 0.0625},
+                         {'title': 'Cook County Tax', 'price': '3.39', 'rate': 0.0175}]
+    data['email'] = None
+    data['reference'] = None
+    data['phone'] = '+1 312 555 0100'
+    data['shipping_address'] = dict(data['shipping_address'], company='SteelSeries', address2='Suite 100')
+    return data
+
+
+class GenerateOrderDataTest(unittest.TestCase):
+    def assertMatchesReference(self, data):
+        mapped = order.generate_order_data(payload.decode_order_event(data))
+        expected = reference_order(data)
+        for field in order.NavOrder._fields:
+            with self.subTest(field=field):
+                self.assertEqual(getattr(mapped, field), getattr(expected, field))
+        return mapped
+
+    def test_sample_matches_reference(self):
+        mapped = self.assertMatchesReference(sample_data())
+
+        self.assertEqual(mapped.order_number, '1010')
+        self.assertEqual(mapped.navision_customer, 'WUS')
+        self.assertEqual(mapped.charge_currency_id, 'USD')
+        self.assertEqual(mapped.shipping_address.country_id, 'US')
+        self.assertEqual(mapped.shipping_address.subdivision_short_id, 'IL')
+        self.assertEqual([line.sku for line in mapped.alacart_items], ['61611'])
+
+    def test_busy_order_matches_reference(self):
+        mapped = self.assertMatchesReference(busy_data())
+
+        self.assertEqual(mapped.email, 'customer@steelseries.com')
+        self.assertEqual(mapped.your_reference, '1010')
+        self.assertEqual([line.total_with_discount_charge for line in mapped.alacart_items],
+                         [Decimal('189.98'), Decimal('179.99')])
+        self.assertEqual(mapped.shipping_method,
+                         order.ShippingMethod('UPS Next Day Air Saver and a v', Decimal('27.50'), Decimal('22.50')))
+        self.assertEqual(mapped.sales_tax_by_region(), {'IL': Decimal('17.51')})
+
+    def test_whole_event_maps_like_its_data(self):
+        event = common.load_sample_event()
+        self.assertEqual(order.generate_order_data(payload.decode_order_event(event)),
+                         order.generate_order_data(payload.decode_order_event(event['data'])))
+
+    def test_unknown_country_is_rejected(self):
+        data = sample_data()
+        data['shipping_address']['country_code'] = 'zz'
+        data['billing_address']['country_code'] = 'zz'
+        with self.assertRaises(navision.OrderValidationError):
+            order.generate_order_data(payload.decode_order_event(data))
+
+    def test_missing_address_is_rejected(self):
+        data = sample_data()
+        data['country_code'] = 'us'
+        data['billing_address'] = None
+        with self.assertRaises(navision.OrderValidationError):
+            order.generate_order_data(payload.decode_order_event(data))
+
+
+class CompileMappingTest(unittest.TestCase):
+    def test_fields_records_and_lists(self):
+        from collections import namedtuple
+        from types import SimpleNamespace as NS
+
+        Inner = namedtuple('Inner', 'a b')
+        Outer = namedtuple('Outer', 'first fallback const inner items upper')
+        map_outer = mapping.compile_mapping(Outer, {
+            'first': mapping.Field('x.y'),
+            'fallback': mapping.Field('missing', 'x.y', default='d'),
+            'const': 42,
+            'inner': mapping.Record('x', Inner, {'a': mapping.Field('y'), 'b': mapping.Field('z', default=0)}),
+            'items': mapping.Each('things', Inner, {'a': mapping.Field(''), 'b': mapping.Field('', transform=len)}),
+            'upper': mapping.Field('name', default='', transform=str.upper),
+        }, 'map_outer')
+
+        source = NS(x=NS(y='v', z=None), missing=None, things=['ab', 'c'], name='n')
+        self.assertEqual(map_outer(source), Outer('v', 'v', 42, Inner('v', 0), (Inner('ab', 2), Inner('c', 1)), 'N'))
+
+        empty = NS(x=None, missing=None, things=None, name=None)
+        self.assertEqual(map_outer(empty), Outer(None, 'd', 42, None, (), ''))
+        self.assertIn('def map_outer(source)', map_outer.source)
+
+    def test_incomplete_mapping_is_rejected(self):
+        from collections import namedtuple
+
+        Pair = namedtuple('Pair', 'a b')
+        with self.assertRaises(ValueError):
+            mapping.compile_mapping(Pair, {'a': mapping.Field('a')})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import importlib.util
+import os
+import threading
+import unittest
+
+# The function folder is not an importable package name, and its __init__ needs the
+# NAVISION_* settings, so load the dependency-free scheduler module on its own
+_spec = importlib.util.spec_from_file_location('scheduler', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'samples-orders-navision-create', 'scheduler.py'))
+scheduler = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(scheduler)
+
+
+class SmallLimitTest(unittest.TestCase):
+    def test_every_class_gets_a_slot(self):
+        for limit in range(1, 9):
+            s = scheduler.PriorityScheduler(limit, scheduler.default_reservations(limit))
+            for cls in scheduler.CLASSES:
+                with self.subTest(limit=limit, cls=scheduler.CLASS_NAMES[cls]):
+                    with s.slot(cls, timeout=1):
+                        pass
+
+    def test_every_class_gets_a_slot_while_the_others_are_busy(self):
+        for limit in range(1, 5):
+            s = scheduler.PriorityScheduler(limit, scheduler.default_reservations(limit))
+            for cls in scheduler.CLASSES:
+                with self.subTest(limit=limit, cls=scheduler.CLASS_NAMES[cls]):
+                    release = threading.Event()
+
+                    def hold(other):
+                        with s.slot(other):
+                            release.wait()
+
+                    others = [threading.Thread(target=hold, args=(other,)) for other in scheduler.CLASSES if other != cls]
+                    for thread in others:
+                        thread.start()
+                    try:
+                        result = []
+
+                        def call():
+                            with s.slot(cls, timeout=5):
+                                result.append(cls)
+
+                        waiter = threading.Thread(target=call)
+                        waiter.start()
+                        # Once the others finish, the class must get a slot rather than wait forever
+                        release.set()
+                        waiter.join(5)
+                        self.assertEqual(result, [cls])
+                    finally:
+                        release.set()
+                        for thread in others:
+                            thread.join(5)
+
+    def test_slot_timeout(self):
+        s = scheduler.PriorityScheduler(1, {})
+        with s.slot(scheduler.BULK):
+            with self.assertRaises(scheduler.SlotTimeout):
+                with s.slot(scheduler.BULK, timeout=0.05):
+                    pass
+
+    def test_timeouts_in_the_slot_are_not_slot_timeouts(self):
+        s = scheduler.PriorityScheduler(1, {})
+        with self.assertRaises(TimeoutError) as raised:
+            with s.slot(scheduler.BULK, timeout=1):
+                raise TimeoutError('read timed out')
+        self.assertNotIsInstance(raised.exception, scheduler.SlotTimeout)
+
+    def test_unreachable_class_is_rejected(self):
+        with self.assertRaises(ValueError):
+            scheduler.PriorityScheduler(1, {scheduler.INTERACTIVE: 1})
+
+    def test_zero_limit_is_rejected(self):
+        with self.assertRaises(ValueError):
+            scheduler.PriorityScheduler(0, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
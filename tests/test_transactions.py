@@ -0,0 +1,135 @@
+import unittest
+from datetime import date
+
+from lxml import etree
+
+from support import load
+
+navision = load('navision')
+fixtures = load('benchmarks.fixtures')
+
+TRANSACTION_NS = 'urn:microsoft-dynamics-nav/xmlports/x50003'
+
+
+def transaction(entry_number, quantity='-1', posting_date='03/15/23', entry_type='Sale'):
+    return fixtures._record('Transaction', TRANSACTION_NS, (
+        ('entryNo', entry_number),
+        ('DocumentNo', 'SH%06d' % entry_number),
+        ('PostingDate', posting_date),
+        ('ItemNo', 61611),
+        ('EntryType', entry_type),
+        ('Quantity', quantity),
+        ('ExternalDocumentNo', 'W%s' % entry_number),
+    ))
+
+
+def response(*records):
+    return fixtures.ENVELOPE % (
+        '<GetTransactions_Result xmlns="%s"><transactions>%s</transactions></GetTransactions_Result>' % (
+            fixtures.GATEWAY_NS, ''.join(records)))
+
+
+def entries(text):
+    return etree.fromstring(text.encode('utf-8')).find('*//{%s}transactions' % fixtures.GATEWAY_NS)
+
+
+class DecodeTransactionsTest(unittest.TestCase):
+    def test_fields(self):
+        decoded = navision.decode_transactions(entries(response(transaction(7, '-3', '12/31/22', 'Transfer'))))
+        self.assertEqual(decoded, [
+            navision.Transaction('SH000007', 7, date(2022, 12, 31), '61611', 'transfer', -3, 'W7'),
+        ])
+
+    def test_quantity_with_thousands_separator(self):
+        decoded = navision.decode_transactions(entries(response(
+            transaction(1, '-1,000'), transaction(2, '12,345,678'), transaction(3, '5'))))
+        self.assertEqual([t.quantity for t in decoded], [-1000, 12345678, 5])
+
+    def test_entry_zero_is_skipped(self):
+        decoded = navision.decode_transactions(entries(response(transaction(0), transaction(1))))
+        self.assertEqual([t.entry_number for t in decoded], [1])
+
+    def test_invalid_quantity_is_dropped(self):
+        with self.assertLogs(navision.logger, 'ERROR') as logs:
+            decoded = navision.decode_transactions(entries(response(
+                transaction(1), transaction(2, 'n/a'), transaction(3, '1.5'), transaction(4))))
+        self.assertEqual([t.entry_number for t in decoded], [1, 4])
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('entryNo[2] quantity[n/a]', logs.output[0])
+
+    def test_missing_quantity_is_zero(self):
+        record = fixtures._record('Transaction', TRANSACTION_NS, (
+            ('entryNo', 5), ('DocumentNo', 'SH5'), ('PostingDate', '01/02/23'), ('ItemNo', 61611),
+            ('EntryType', 'Sale'), ('ExternalDocumentNo', 'W5'),
+        ))
+        decoded = navision.decode_transactions(entries(response(record)))
+        self.assertEqual(decoded, [navision.Transaction('SH5', 5, date(2023, 1, 2), '61611', 'sale', 0, 'W5')])
+
+    def test_appends_to_into(self):
+        into = [None]
+        result = navision.decode_transactions(entries(response(transaction(1))), into)
+        self.assertIs(result, into)
+        self.assertEqual([t and t.entry_number for t in into], [None, 1])
+
+    def test_columns_match_list(self):
+        page = entries(fixtures.transactions_response(200, after_entry=1000))
+        decoded = navision.decode_transactions(page)
+        columns = navision.decode_transactions(page, navision.TransactionColumns())
+
+        self.assertEqual(len(decoded), 200)
+        self.assertEqual(len(columns), len(decoded))
+        self.assertEqual(list(columns), decoded)
+        self.assertEqual([columns[i] for i in range(len(columns))], decoded)
+        self.assertEqual(columns[0], navision.Transaction('SH000000', 1001, date(2023, 1, 1), '61600', 'transfer',
+                                                         -1000, 'W1000'))
+
+
+class GetTransactionPageTest(unittest.TestCase):
+    def client(self, text):
+        client = navision.Navision('http://navision.invalid/nav', 'user', 'password', order_number_prefix='W')
+        client.session = fixtures.StubSession({'GetTransactions': text})
+        return client
+
+    def test_counts_entries_the_decoder_dropped(self):
+        client = self.client(response(transaction(11), transaction(12, 'bad'), transaction(13, 'bad')))
+        with self.assertLogs(navision.logger, 'ERROR'):
+            page = client.get_transaction_page('WEB', 10, num_entries=3)
+        self.assertEqual([t.entry_number for t in page.transactions], [11])
+        self.assertEqual(page.entries, 3)
+        self.assertEqual(page.last_entry, 13)
+
+    def test_empty_page_stays_at_after_entry(self):
+        page = self.client(response()).get_transaction_page('WEB', 10)
+        self.assertEqual(page, navision.TransactionPage([], 0, 10))
+
+    def test_socket_timeout_is_not_a_missed_deadline(self):
+        client = self.client(response())
+
+        def post(url, headers=None, data=None, timeout=None):
+            raise TimeoutError('The read operation timed out')
+
+        client.session.post = post
+        with client.deadline(navision.Deadline(60)):
+            with self.assertRaises(TimeoutError) as raised:
+                client.get_transaction_page('WEB', 10)
+        self.assertNotIsInstance(raised.exception, navision.DeadlineExceeded)
+
+    def test_no_slot_before_the_deadline(self):
+        client = self.client(response())
+        client.scheduler = navision.PriorityScheduler(1, {})
+        client.min_call_time = 0
+        with client.scheduler.slot(navision.INTERACTIVE):
+            with client.deadline(navision.Deadline(0.1)):
+                with self.assertRaises(navision.DeadlineExceeded):
+                    client.get_transaction_page('WEB', 10)
+
+    def test_columns(self):
+        client = self.client(fixtures.transactions_response(20, after_entry=40))
+        page = client.get_transaction_page('WEB', 40, num_entries=20, columns=True)
+        self.assertIsInstance(page.transactions, navision.TransactionColumns)
+        self.assertEqual((page.entries, page.last_entry), (20, 60))
+        self.assertEqual(list(page.transactions), client.get_transactions('WEB', 40, num_entries=20))
+
+
+if __name__ == '__main__':
+    unittest.main()